@@ -1,10 +1,18 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict
 from typing import Dict, Any, Optional
-import uuid
+from uuid import uuid4
+import logging
+import os
+import orjson
 from app.engine.factory import EngineFactory, get_engine
+from app.engine.batching import BatchScheduler
+from app.engine.downloads import DownloadWorkerPool, size_priority
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # Helper to get service or raise error
 def get_service_or_raise():
@@ -18,6 +26,7 @@ def get_service_or_raise():
     return service
 
 class FineTuneRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", protected_namespaces=())
     model_id: str
     dataset_path: str
     epochs: int = 3
@@ -28,6 +37,7 @@ class FineTuneRequest(BaseModel):
     max_seq_length: int = 512
     lora_dropout: float = 0.0
     lora_layers: int = 8
+    quantize: bool = False # QLoRA: train adapters over a 4-bit base (MLX)
     job_name: str = "" # Optional user provided name
 
 @router.post("/finetune")
@@ -36,10 +46,10 @@ async def start_finetune(request: FineTuneRequest):
     Start a fine-tuning job.
     """
     service = get_service_or_raise()
-    job_id = str(uuid.uuid4())
-    print(f"DEBUG API: Received finetune request. Job Name: '{request.job_name}'")
+    job_id = uuid4().hex
+    logger.debug("Received finetune request. Job Name: '%s'", request.job_name)
     config = request.model_dump()
-    print(f"DEBUG API: Config dump: {config}")
+    logger.debug("Config dump: %s", config)
     result = await service.start_finetuning(job_id, config)
     return result
 
@@ -49,7 +59,7 @@ async def get_job_status(job_id: str):
     Get status of a fine-tuning job.
     """
     service = get_service_or_raise()
-    status = service.get_job_status(job_id)
+    status = await run_in_threadpool(service.get_job_status, job_id)
     if status["status"] == "not_found":
         raise HTTPException(status_code=404, detail="Job not found")
     return status
@@ -60,19 +70,49 @@ async def list_models():
     List supported base models with their local download status.
     """
     service = get_service_or_raise()
-    return service.get_models_status()
+    status = await run_in_threadpool(service.get_models_status)
+    return [_with_queue_state(entry) for entry in status]
+
+@router.get("/models/stream")
+async def stream_models():
+    """
+    Stream model statuses as NDJSON, one line per model as soon as it is checked.
+    """
+    service = get_service_or_raise()
+
+    def ndjson():
+        # Sync generator: StreamingResponse iterates it in the threadpool
+        for entry in service.iter_models_status():
+            yield orjson.dumps(_with_queue_state(entry)) + b"\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 class DownloadRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", protected_namespaces=())
     model_id: str
 
+# Persistent download workers, started with the app (see main.py)
+download_pool = DownloadWorkerPool(get_engine)
+
+def _with_queue_state(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Mark models waiting in the download queue. The engine only knows about downloads a worker
+    has started, so without this a queued model looks idle until its turn comes.
+    """
+    if entry["id"] in download_pool.pending and not entry.get("downloading"):
+        # New dict: the engine may hand out cached status entries
+        return {**entry, "downloading": True, "queued": True}
+    return entry
+
 @router.post("/models/download")
-async def download_model(request: DownloadRequest, background_tasks: BackgroundTasks):
+async def download_model(request: DownloadRequest):
     """
-    Trigger a model download in the background.
+    Queue a model download on the background download workers.
     """
     service = get_service_or_raise()
-    background_tasks.add_task(service.download_model, request.model_id)
-    return {"status": "download_started", "model_id": request.model_id}
+    entry = next((m for m in service.get_supported_models() if m["id"] == request.model_id), None)
+    queued = await download_pool.submit(request.model_id, size_priority(entry))
+    return {"status": "queued" if queued else "already_queued", "model_id": request.model_id}
 
 @router.post("/models/delete")
 async def delete_model(request: DownloadRequest):
@@ -80,12 +120,13 @@ async def delete_model(request: DownloadRequest):
     Delete a locally downloaded model.
     """
     service = get_service_or_raise()
-    success = service.delete_model(request.model_id)
+    success = await run_in_threadpool(service.delete_model, request.model_id)
     if not success:
          raise HTTPException(status_code=404, detail="Model not found or could not be deleted")
     return {"status": "deleted", "model_id": request.model_id}
 
 class RegisterRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", protected_namespaces=())
     name: str
     path: str
     url: str = ""
@@ -97,14 +138,22 @@ async def register_model(request: RegisterRequest):
     """
     service = get_service_or_raise()
     try:
-        new_model = service.register_model(request.name, request.path, request.url)
+        new_model = await run_in_threadpool(service.register_model, request.name, request.path, request.url)
         return new_model
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _dispatch_chat_batch(model_id: str, batch: list):
+    service = get_service_or_raise()
+    return await service.generate_response_batch(model_id, batch)
+
+# Coalesces concurrent /chat calls per model into batched generation
+chat_batcher = BatchScheduler(_dispatch_chat_batch)
+
 class ChatRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", protected_namespaces=())
     model_id: str
     messages: list
     temperature: float = 0.7
@@ -114,13 +163,33 @@ async def chat_generation(request: ChatRequest):
     """
     Generate a response from the model.
     """
-    service = get_service_or_raise()
-    response = await service.generate_response(request.model_id, request.messages)
+    get_service_or_raise()
+    future = await chat_batcher.enqueue(request.model_id, request.messages)
+    response = await future
     return response
 
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Stream the response as server-sent events, one event per decoded text segment.
+    """
+    service = get_service_or_raise()
+
+    async def events():
+        try:
+            async for chunk in service.stream_response(request.model_id, request.messages):
+                yield b"data: " + orjson.dumps({"content": chunk}) + b"\n\n"
+        except Exception as e:
+            logger.exception("Streaming generation error: %s", e)
+            yield b"event: error\ndata: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 # --- New Configuration Endpoints ---
 
 class EngineSelectRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", protected_namespaces=())
     engine: str
 
 @router.get("/status")
@@ -130,21 +199,14 @@ async def get_engine_status():
     """
     config = EngineFactory.get_engine_config()
     caps = EngineFactory.get_hardware_capabilities()
-    active_engine = "none"
     service = get_engine()
-    if service:
-        # Determine type
-        from app.engine.mlx_service import MLXEngineService
-        from app.engine.unsloth_service import UnslothEngineService
-        if isinstance(service, MLXEngineService):
-            active_engine = "mlx"
-        elif isinstance(service, UnslothEngineService):
-            active_engine = "unsloth"
+    active_engine = (EngineFactory._engine_kind or "none") if service else "none"
 
     return {
         "engine": active_engine,
         "config_engine": config.get("engine", None),
-        "hardware": caps
+        "hardware": caps,
+        "worker_pid": os.getpid() # Distinguishes workers when WEB_CONCURRENCY > 1
     }
 
 @router.post("/select")
@@ -155,8 +217,8 @@ async def select_engine(request: EngineSelectRequest):
     if request.engine not in ["mlx", "unsloth"]:
         raise HTTPException(status_code=400, detail="Invalid engine selection. Must be 'mlx' or 'unsloth'.")
 
-    # Check compatibility
-    caps = EngineFactory.get_hardware_capabilities()
+    # Check compatibility against a fresh probe
+    caps = EngineFactory.refresh_capabilities()
     if request.engine == "unsloth" and not caps["cuda"]:
         raise HTTPException(status_code=400, detail="CUDA not found. Cannot select Unsloth.")
     if request.engine == "mlx" and not caps["mlx"]:
@@ -164,7 +226,7 @@ async def select_engine(request: EngineSelectRequest):
 
     EngineFactory.set_engine_config(request.engine)
 
-    # Trigger factory re-init check
-    new_service = get_engine()
+    # Trigger factory re-init check, reusing the probe from above
+    new_service = EngineFactory.get_service(caps=caps)
 
     return {"status": "ok", "engine": request.engine}
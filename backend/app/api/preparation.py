@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
 from app.preparation.service import DataPreparationService
 
@@ -21,10 +22,12 @@ def get_service():
     return _service
 
 class PreviewRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", protected_namespaces=())
     file_path: str
     limit: int = 5
 
 class ConversionRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", protected_namespaces=())
     file_path: str
     output_path: str
     instruction_col: str
@@ -40,7 +43,7 @@ async def preview_csv(request: PreviewRequest):
     """
     try:
         svc = get_service()
-        data = svc.preview_csv(request.file_path, request.limit)
+        data = await run_in_threadpool(svc.preview_csv, request.file_path, request.limit)
         return {"data": data}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -52,7 +55,8 @@ async def convert_to_jsonl(request: ConversionRequest):
     """
     try:
         svc = get_service()
-        result = svc.convert_csv_to_jsonl(
+        result = await run_in_threadpool(
+            svc.convert_csv_to_jsonl,
             request.file_path,
             request.output_path,
             request.instruction_col,
@@ -1,7 +1,14 @@
+import os
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from pathlib import Path
+from typing import Dict, Any, AsyncIterator, Iterator, List
 
 class BaseEngineService(ABC):
+    # Seconds a built status list is served before re-checking disk (mutations invalidate it sooner)
+    MODELS_STATUS_TTL = 5.0
+    _status_cache = None # (monotonic time, status list)
+
     @abstractmethod
     def get_supported_models(self) -> List[Dict[str, Any]]:
         """Return a list of supported models configuration."""
@@ -27,6 +34,15 @@ class BaseEngineService(ABC):
         """Generate a chat response."""
         pass
 
+    async def stream_response(self, model_id: str, messages: list) -> AsyncIterator[str]:
+        """Yield the chat response as text chunks while it is generated."""
+        response = await self.generate_response(model_id, messages)
+        yield response["content"]
+
+    async def generate_response_batch(self, model_id: str, batch: List[list]) -> List[Dict[str, Any]]:
+        """Generate chat responses for several conversations on the same model."""
+        return [await self.generate_response(model_id, messages) for messages in batch]
+
     @abstractmethod
     async def start_finetuning(self, job_id: str, config: Dict[str, Any]) -> Dict[str, Any]:
         """Start a fine-tuning job."""
@@ -42,6 +58,26 @@ class BaseEngineService(ABC):
         """Return models with download status."""
         pass
 
+    def iter_models_status(self) -> Iterator[Dict[str, Any]]:
+        """Yield models with download status one at a time."""
+        yield from self.get_models_status()
+
+    def _cached_models_status(self) -> List[Dict[str, Any]]:
+        """
+        iter_models_status as a list, memoized until _invalidate_models_status() or MODELS_STATUS_TTL.
+        Rebuilt on every call while a download is running so its progress stays live.
+        """
+        cached = self._status_cache
+        now = time.monotonic()
+        if cached is not None and now - cached[0] < self.MODELS_STATUS_TTL and not getattr(self, "active_downloads", None):
+            return cached[1]
+        status = list(self.iter_models_status())
+        self._status_cache = (now, status)
+        return status
+
+    def _invalidate_models_status(self):
+        self._status_cache = None
+
     @abstractmethod
     def download_model(self, model_id: str) -> bool:
         """Download a model."""
@@ -51,3 +87,25 @@ class BaseEngineService(ABC):
     def delete_model(self, model_id: str) -> bool:
         """Delete a model."""
         pass
+
+    def _get_dir_size_str(self, path: Path) -> str:
+        """Total size of a directory tree as e.g. "4.2GB", skipping symlinks."""
+        try:
+            total_size = 0
+            # scandir hands back each entry's stat with the listing, one syscall per file instead of three
+            stack = [path]
+            while stack:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total_size += entry.stat(follow_symlinks=False).st_size
+
+            gb = total_size / (1024 * 1024 * 1024)
+            if gb < 1:
+                return f"{gb:.2f}GB"
+            return f"{gb:.1f}GB"
+        except Exception as e:
+            print(f"Error calculating size for {path}: {e}")
+            return "Unknown"
@@ -0,0 +1,111 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+# Tunables, analogous to OLLAMA_NUM_PARALLEL
+CHAT_MAX_BATCH = int(os.getenv("CHAT_MAX_BATCH", 4))
+CHAT_MAX_LATENCY_MS = float(os.getenv("CHAT_MAX_LATENCY_MS", 10))
+CHAT_QUEUE_SIZE = int(os.getenv("CHAT_QUEUE_SIZE", 64))
+# Batches per model dispatched but not yet finished; past this the queue fills and enqueue waits
+CHAT_MAX_INFLIGHT = int(os.getenv("CHAT_MAX_INFLIGHT", 4))
+# Seconds a model's worker waits for work before exiting (model ids come straight from requests)
+CHAT_WORKER_IDLE_S = float(os.getenv("CHAT_WORKER_IDLE_S", 30))
+
+BatchDispatch = Callable[[str, List[list]], Awaitable[List[Dict[str, Any]]]]
+
+class BatchScheduler:
+    """
+    Coalesces concurrent chat requests for the same model into one batched call.
+    Each model gets its own bounded queue and a worker task that waits up to
+    max_latency_ms for more requests (or until max_batch) before dispatching.
+    Up to max_inflight batches per model run at once, so a continuous-batching
+    engine can fold a new batch into its running decode loop.
+    A worker left idle for idle_timeout seconds exits and drops its queue.
+    """
+    def __init__(self, dispatch: BatchDispatch, max_batch: int = CHAT_MAX_BATCH,
+                 max_latency_ms: float = CHAT_MAX_LATENCY_MS, queue_size: int = CHAT_QUEUE_SIZE,
+                 idle_timeout: float = CHAT_WORKER_IDLE_S, max_inflight: int = CHAT_MAX_INFLIGHT):
+        self.dispatch = dispatch
+        self.max_batch = max(1, max_batch)
+        self.max_latency = max(0.0, max_latency_ms) / 1000
+        self.queue_size = queue_size
+        self.idle_timeout = idle_timeout
+        self.max_inflight = max(1, max_inflight)
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.workers: Dict[str, asyncio.Task] = {}
+        self.inflight: Set[asyncio.Task] = set()
+
+    async def enqueue(self, model_id: str, messages: list) -> asyncio.Future:
+        """
+        Queue a conversation for generation. Returns a future resolved with its response.
+        """
+        loop = asyncio.get_running_loop()
+        queue = self.queues.get(model_id)
+        if queue is None:
+            queue = self.queues[model_id] = asyncio.Queue(maxsize=self.queue_size)
+            self.workers[model_id] = loop.create_task(self._worker(model_id, queue))
+
+        future = loop.create_future()
+        await queue.put((messages, future))
+        return future
+
+    async def _collect(self, queue: asyncio.Queue) -> List[Tuple[list, asyncio.Future]]:
+        """
+        The next batch, or an empty list if nothing arrived within idle_timeout.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            batch = [await asyncio.wait_for(queue.get(), self.idle_timeout)]
+        except asyncio.TimeoutError:
+            return []
+        deadline = loop.time() + self.max_latency
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self, model_id: str, queue: asyncio.Queue):
+        slots = asyncio.Semaphore(self.max_inflight)
+        while True:
+            # Wait for a free slot before draining the queue, so callers queue up behind it
+            await slots.acquire()
+            batch = await self._collect(queue)
+            if not batch and queue.empty():
+                # Idle: retire this worker. No await between the check and the removal, so a
+                # request enqueued after this point gets a fresh queue and worker.
+                del self.queues[model_id]
+                del self.workers[model_id]
+                return
+            # Skip callers that went away while queued
+            batch = [(messages, fut) for messages, fut in batch if not fut.done()]
+            if not batch:
+                slots.release()
+                continue
+            # Don't wait for this batch to finish: engines with continuous batching
+            # can fold the next batch into the decode loop that is already running
+            task = asyncio.create_task(self._run_batch(model_id, batch))
+            self.inflight.add(task)
+            task.add_done_callback(self.inflight.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _run_batch(self, model_id: str, batch: List[Tuple[list, asyncio.Future]]):
+        try:
+            results = await self.dispatch(model_id, [messages for messages, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+        # A short result list must not leave callers waiting forever
+        for _, fut in batch[len(results):]:
+            if not fut.done():
+                fut.set_exception(RuntimeError(f"Batch returned {len(results)} results for {len(batch)} requests"))
@@ -0,0 +1,76 @@
+import asyncio
+import itertools
+import os
+from typing import Callable, List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 2))
+
+def size_priority(model_entry: Optional[dict]) -> float:
+    """
+    Queue priority from a models.json entry's "size" (e.g. "10.5GB"). Smaller downloads go first.
+    """
+    if not model_entry:
+        return float("inf")
+    size = str(model_entry.get("size", "")).strip().upper()
+    try:
+        if size.endswith("GB"):
+            return float(size[:-2])
+        if size.endswith("MB"):
+            return float(size[:-2]) / 1024
+    except ValueError:
+        pass
+    return float("inf")
+
+class DownloadWorkerPool:
+    """
+    Persistent model download workers fed from a priority queue.
+    Requests are acknowledged as soon as they are queued; the blocking
+    service.download_model call runs in the threadpool on a worker task.
+    """
+    def __init__(self, get_service: Callable, workers: int = DOWNLOAD_WORKERS):
+        self.get_service = get_service
+        self.num_workers = max(1, workers)
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self.workers: List[asyncio.Task] = []
+        self.pending: Set[str] = set()
+        self._counter = itertools.count() # FIFO tie-break for equal priorities
+
+    def start(self):
+        if self.workers:
+            return
+        self.queue = asyncio.PriorityQueue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def stop(self):
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def submit(self, model_id: str, priority: float = float("inf")) -> bool:
+        """
+        Queue a download. Returns False if the model is already queued.
+        """
+        if model_id in self.pending:
+            return False
+        self.start()
+        self.pending.add(model_id)
+        await self.queue.put((priority, next(self._counter), model_id))
+        return True
+
+    async def _worker(self):
+        while True:
+            _, _, model_id = await self.queue.get()
+            try:
+                service = self.get_service()
+                if service:
+                    await run_in_threadpool(service.download_model, model_id)
+                else:
+                    print(f"Download worker: no engine available for {model_id}")
+            except Exception as e:
+                print(f"Download worker: failed to download {model_id}: {e}")
+            finally:
+                self.pending.discard(model_id)
+                self.queue.task_done()
@@ -1,55 +1,93 @@
 import os
-import json
+import logging
 from pathlib import Path
 from typing import Optional
+import orjson
 from app.engine.base import BaseEngineService
 
+# Probe optional backends once at import instead of inside every capability check
+try:
+    import mlx.core as _mlx
+    _HAS_MLX = True
+except ImportError:
+    _HAS_MLX = False
+
+try:
+    import torch as _torch
+    _HAS_TORCH = True
+except ImportError:
+    _torch = None
+    _HAS_TORCH = False
+
+logger = logging.getLogger(__name__)
+
+# Module-level handle on the active service so get_engine() can skip the factory
+_ENGINE: Optional[BaseEngineService] = None
+
 class EngineFactory:
     _instance: Optional[BaseEngineService] = None
+    _engine_kind: Optional[str] = None # "mlx" / "unsloth" for the active instance
     _config_path = Path("engine_config.json")
+    _caps_cache: Optional[dict] = None
+    _config_cache: Optional[dict] = None
 
     @classmethod
     def get_engine_config(cls):
+        if cls._config_cache is not None:
+            return cls._config_cache
+
+        config = {}
         if cls._config_path.exists():
             try:
-                with open(cls._config_path, "r") as f:
-                    return json.load(f)
+                with open(cls._config_path, "rb") as f:
+                    data = f.read()
+                config = orjson.loads(data)
             except Exception:
-                return {}
-        return {}
+                config = {}
+        cls._config_cache = config
+        return config
 
     @classmethod
     def set_engine_config(cls, engine: str):
-        with open(cls._config_path, "w") as f:
-            json.dump({"engine": engine}, f, indent=4)
+        global _ENGINE
+        with open(cls._config_path, "wb") as f:
+            f.write(orjson.dumps({"engine": engine}, option=orjson.OPT_INDENT_2))
+        cls._config_cache = {"engine": engine}
         # Reset instance to force reload on next get
         cls._instance = None
+        cls._engine_kind = None
+        _ENGINE = None
+        # Environment may have changed, re-probe hardware on next get
+        cls._caps_cache = None
+
+    @classmethod
+    def refresh_capabilities(cls):
+        """Drop the cached hardware probe and run it again."""
+        cls._caps_cache = None
+        return cls.get_hardware_capabilities()
 
     @classmethod
     def get_hardware_capabilities(cls):
+        # Probing imports torch/mlx and initializes the CUDA driver, only do it once
+        if cls._caps_cache is not None:
+            return cls._caps_cache
+
         capabilities = {
-            "mlx": False,
-            "cuda": False,
+            "mlx": _HAS_MLX,
+            "cuda": _HAS_TORCH and _torch.cuda.is_available(),
             "recommended": None
         }
 
-        try:
-            import mlx.core
-            capabilities["mlx"] = True
-        except ImportError:
-            pass
-
-        try:
-            import torch
-            if torch.cuda.is_available():
-                capabilities["cuda"] = True
-        except ImportError:
-            pass
-
+        cls._caps_cache = capabilities
         return capabilities
 
     @classmethod
-    def get_service(cls) -> Optional[BaseEngineService]:
+    def get_service(cls, caps: Optional[dict] = None) -> Optional[BaseEngineService]:
+        """
+        Return the active engine, creating it on first use.
+        Callers that just probed the hardware can pass caps to avoid a second probe.
+        """
+        global _ENGINE
         if cls._instance:
             return cls._instance
 
@@ -57,22 +95,25 @@ class EngineFactory:
         config = cls.get_engine_config()
         selected_engine = config.get("engine")
 
-        caps = cls.get_hardware_capabilities()
+        if caps is None:
+            caps = cls.get_hardware_capabilities()
+        elif cls._caps_cache is None:
+            cls._caps_cache = caps
 
         # 2. Validation & Fallback
         if selected_engine == "unsloth":
             if not caps["cuda"]:
-                print("WARNING: Unsloth selected but CUDA not found.")
+                logger.warning("Unsloth selected but CUDA not found.")
                 if caps["mlx"]:
-                    print("Fallback to MLX.")
+                    logger.warning("Fallback to MLX.")
                     selected_engine = "mlx"
                 else:
-                    print("CRITICAL: No compatible hardware found.")
+                    logger.critical("No compatible hardware found.")
                     return None
 
         elif selected_engine == "mlx":
             if not caps["mlx"]:
-                print("WARNING: MLX selected but not found.")
+                logger.warning("MLX selected but not found.")
                 # Fallback?
                 if caps["cuda"]:
                     selected_engine = "unsloth"
@@ -92,18 +133,20 @@ class EngineFactory:
         if selected_engine == "mlx":
             from app.engine.mlx_service import MLXEngineService
             cls._instance = MLXEngineService()
-            print("Engine Factory: Initialized MLX Engine")
+            logger.info("Engine Factory: Initialized MLX Engine")
 
         elif selected_engine == "unsloth":
             from app.engine.unsloth_service import UnslothEngineService
             cls._instance = UnslothEngineService()
-            print("Engine Factory: Initialized Unsloth Engine")
+            logger.info("Engine Factory: Initialized Unsloth Engine")
         else:
-            print(f"Engine Factory: Unknown engine {selected_engine}")
+            logger.error("Engine Factory: Unknown engine %s", selected_engine)
             return None
 
+        cls._engine_kind = selected_engine
+        _ENGINE = cls._instance
         return cls._instance
 
 # Global helper
 def get_engine():
-    return EngineFactory.get_service()
+    return _ENGINE if _ENGINE is not None else EngineFactory.get_service()
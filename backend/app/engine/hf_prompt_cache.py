@@ -0,0 +1,82 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import torch
+
+# KV caches kept on the GPU between chat turns
+HF_PROMPT_CACHE_ENTRIES = int(os.getenv("UNSLOTH_PROMPT_CACHE_ENTRIES", 4))
+# Shortest shared prefix worth taking a cache out of the pool for. Below this (e.g. only BOS and
+# a system header in common) the prompt is unrelated, and cropping would destroy the entry.
+HF_PROMPT_CACHE_MIN_PREFIX = int(os.getenv("UNSLOTH_PROMPT_CACHE_MIN_PREFIX", 32))
+
+def _common_prefix_len(a: torch.Tensor, b: torch.Tensor) -> int:
+    n = min(a.shape[-1], b.shape[-1])
+    if n == 0:
+        return 0
+    return int((a[:n] == b[:n]).int().cumprod(0).sum())
+
+class _Entry:
+    __slots__ = ("model_id", "tokens", "cache")
+
+    def __init__(self, model_id: str, tokens: torch.Tensor, cache):
+        self.model_id = model_id
+        self.tokens = tokens
+        self.cache = cache
+
+class HFPromptCachePool:
+    """
+    past_key_values from finished transformers generations, matched to new prompts by
+    token prefix (the Unsloth counterpart of the MLX PromptCachePool). The next chat
+    turn re-renders the history, so generate only has to prefill the new suffix.
+    Caches are checked out exclusively while a generation extends them.
+    """
+    def __init__(self, max_entries: int = HF_PROMPT_CACHE_ENTRIES, min_prefix: int = HF_PROMPT_CACHE_MIN_PREFIX):
+        self.max_entries = max_entries
+        self.min_prefix = max(1, min_prefix)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, model_id: str, input_ids: torch.Tensor) -> Optional[object]:
+        """
+        Returns a cache holding a prefix of input_ids (1-D), or None to prefill from scratch.
+        """
+        with self._lock:
+            best_key, best_len = None, 0
+            for key, entry in self._entries.items():
+                if entry.model_id != model_id:
+                    continue
+                common = _common_prefix_len(entry.tokens, input_ids)
+                if common > best_len:
+                    best_key, best_len = key, common
+            # Always leave at least one token for generate to run
+            keep = min(best_len, input_ids.shape[-1] - 1)
+            if best_key is None or keep < self.min_prefix:
+                return None # Entries stay untouched for the conversations they belong to
+            entry = self._entries.pop(best_key)
+
+        if keep < entry.cache.get_seq_length():
+            entry.cache.crop(keep)
+        return entry.cache
+
+    def store(self, model_id: str, sequence: torch.Tensor, cache):
+        """
+        Return a cache after generation. sequence is the full prompt + reply (1-D).
+        """
+        # Legacy tuple caches can't be cropped to a shared prefix
+        if not (hasattr(cache, "crop") and hasattr(cache, "get_seq_length")):
+            return
+        length = cache.get_seq_length()
+        entry = _Entry(model_id, sequence[:length], cache)
+        with self._lock:
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def drop(self, model_id: str):
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.model_id == model_id]:
+                del self._entries[key]
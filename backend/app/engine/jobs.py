@@ -0,0 +1,29 @@
+import copy
+import threading
+from typing import Any, Dict
+
+class JobRegistry:
+    """
+    Fine-tuning job state shared between training threads and request handlers.
+    Writes happen under a lock; readers get a deep-copied snapshot, never the live dict.
+    """
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id] = dict(fields)
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs.setdefault(job_id, {}).update(fields)
+
+    def get(self, job_id: str, default=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job is not None else default
+
+    def __contains__(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._jobs
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import queue
+import threading
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+try:
+    from mlx_lm.generate import BatchGenerator
+except ImportError:
+    # Older mlx_lm releases have no batched generation
+    BatchGenerator = None
+
+CONTINUOUS_BATCHING = BatchGenerator is not None
+
+# Max sequences decoded together in one step
+MLX_DECODE_BATCH = int(os.getenv("MLX_DECODE_BATCH", 16))
+
+def _resolve(future: asyncio.Future, result=None, error: Exception = None):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+class _Request:
+    __slots__ = ("prompt", "max_tokens", "tokens", "future", "loop", "on_token")
+
+    def __init__(self, prompt: List[int], max_tokens: int, future: asyncio.Future, loop,
+                 on_token: Callable[[int], None] = None):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.tokens: List[int] = []
+        self.future = future
+        self.loop = loop
+        self.on_token = on_token # Called on the event loop with each generated token id
+
+    def finish(self, result=None, error: Exception = None):
+        self.loop.call_soon_threadsafe(_resolve, self.future, result, error)
+
+class ContinuousBatcher:
+    """
+    Continuous batching for one loaded model. A single decode thread owns an
+    mlx_lm BatchGenerator; prompts join between decode steps and finished
+    sequences drop out, so concurrent chats share every forward pass.
+    The thread starts with the first submitted prompt.
+    """
+    def __init__(self, model, tokenizer, max_batch: int = MLX_DECODE_BATCH, on_idle: Callable[[], None] = None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch = max(1, max_batch)
+        self.on_idle = on_idle # Called on the event loop whenever the last pending request finishes
+        self.pending = 0 # Submitted requests the decode thread hasn't finished yet
+        self._incoming: "queue.Queue" = queue.Queue()
+        self._active: Dict[int, _Request] = {}
+        self._lock = threading.Lock()
+        self.error: Optional[Exception] = None # Set once the decode thread has stopped
+        self._thread: Optional[threading.Thread] = None
+
+    async def submit(self, prompt: List[int], max_tokens: int = 200) -> List[int]:
+        """
+        Queue a tokenized prompt; resolves with the generated token ids (EOS excluded).
+        """
+        loop = asyncio.get_running_loop()
+        request = _Request(prompt, max_tokens, loop.create_future(), loop)
+        self._enqueue(request)
+        return await request.future
+
+    async def stream(self, prompt: List[int], max_tokens: int = 200) -> AsyncIterator[int]:
+        """
+        Like submit, but yields each generated token id as soon as its decode step finishes.
+        """
+        loop = asyncio.get_running_loop()
+        tokens: asyncio.Queue = asyncio.Queue()
+        request = _Request(prompt, max_tokens, loop.create_future(), loop, on_token=tokens.put_nowait)
+        # Runs after every token callback the decode thread scheduled before finishing the request
+        request.future.add_done_callback(lambda _: tokens.put_nowait(None))
+        self._enqueue(request)
+        while True:
+            token = await tokens.get()
+            if token is None:
+                break
+            yield token
+        request.future.result() # Raises if decoding failed
+
+    def _enqueue(self, request: _Request):
+        with self._lock:
+            if self.error is not None:
+                raise self.error
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mlx-decode", daemon=True)
+                self._thread.start()
+            self._incoming.put(request)
+            self.pending += 1
+
+    @property
+    def busy(self) -> bool:
+        return self.pending > 0
+
+    def close(self):
+        self._incoming.put(None)
+
+    def _finish(self, request: _Request, result=None, error: Exception = None):
+        with self._lock:
+            self.pending -= 1
+            idle = self.pending == 0
+        request.finish(result, error)
+        if idle and self.on_idle is not None:
+            request.loop.call_soon_threadsafe(self.on_idle)
+
+    def _new_generator(self):
+        stop_tokens = getattr(self.tokenizer, "eos_token_ids", None) or {self.tokenizer.eos_token_id}
+        return BatchGenerator(self.model, stop_tokens=set(stop_tokens), completion_batch_size=self.max_batch)
+
+    def _fail_active(self, error: Exception):
+        for request in self._active.values():
+            self._finish(request, error=error)
+        self._active.clear()
+
+    def _run(self):
+        try:
+            self._decode_loop()
+        except Exception as e:
+            print(f"Batched decode loop stopped: {e}")
+            self._shutdown(e)
+
+    def _shutdown(self, error: Exception):
+        with self._lock:
+            self.error = error
+            pending = []
+            while True:
+                try:
+                    pending.append(self._incoming.get_nowait())
+                except queue.Empty:
+                    break
+        self._fail_active(error)
+        for request in pending:
+            if request is not None:
+                self._finish(request, error=error)
+
+    def _decode_loop(self):
+        gen = self._new_generator()
+        while True:
+            # Block while idle, otherwise just pick up whatever arrived since the last step
+            new = []
+            try:
+                item = self._incoming.get(block=not self._active)
+                while True:
+                    if item is None:
+                        for request in new:
+                            self._finish(request, error=RuntimeError("Model was unloaded"))
+                        self._shutdown(RuntimeError("Model was unloaded"))
+                        return
+                    new.append(item)
+                    item = self._incoming.get_nowait()
+            except queue.Empty:
+                pass
+
+            if new:
+                try:
+                    uids = gen.insert([r.prompt for r in new], [r.max_tokens for r in new])
+                    self._active.update(zip(uids, new))
+                except Exception as e:
+                    for request in new:
+                        self._finish(request, error=e)
+
+            if not self._active:
+                continue
+
+            try:
+                responses = gen.next()
+            except Exception as e:
+                print(f"Batched decode error: {e}")
+                self._fail_active(e)
+                gen = self._new_generator()
+                continue
+
+            for response in responses:
+                request = self._active.get(response.uid)
+                if request is None:
+                    continue
+                if response.finish_reason != "stop":
+                    request.tokens.append(response.token)
+                    if request.on_token is not None:
+                        request.loop.call_soon_threadsafe(request.on_token, response.token)
+                if response.finish_reason is not None:
+                    del self._active[response.uid]
+                    self._finish(request, result=request.tokens)
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable
+
+import mlx.core as mx
+import numpy as np
+from mlx_lm.tuner.datasets import CacheDataset
+from mlx_lm.tuner.trainer import iterate_batches
+
+# Smallest padded batch length; buckets double from here up to max_seq_length
+MIN_BUCKET_LENGTH = 64
+
+# Disk budget for tokenized datasets; the least recently used are removed past it
+DATASET_CACHE_MAX_BYTES = int(os.getenv("MLX_DATASET_CACHE_BYTES", 4 * 1024 ** 3))
+
+def dataset_cache_key(dataset_path: str, model_id: str, split: str, num_samples: int) -> str:
+    """
+    Identifies a tokenized split: the source file (path, size, mtime), the tokenizer's model and the split.
+    """
+    stat = os.stat(dataset_path)
+    raw = f"{os.path.abspath(dataset_path)}|{stat.st_size}|{stat.st_mtime_ns}|{model_id}|{split}|{num_samples}"
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+class TokenizedDataset(CacheDataset):
+    """
+    Pre-tokenized samples in one contiguous int32 memmap (ids.bin) with a
+    boundaries array (offsets.npy). Items are zero-copy slices; prompt_offsets.npy
+    is present when the source dataset yields (tokens, prompt_offset) pairs.
+    """
+    def __init__(self, cache_dir: Path):
+        self._offsets = np.load(cache_dir / "offsets.npy")
+        total = int(self._offsets[-1])
+        # np.memmap can't map an empty file
+        self._ids = np.memmap(cache_dir / "ids.bin", dtype=np.int32, mode="r") if total else np.zeros(0, dtype=np.int32)
+        prompt_offsets = cache_dir / "prompt_offsets.npy"
+        self._prompt_offsets = np.load(prompt_offsets) if prompt_offsets.exists() else None
+
+    def itemlen(self, idx: int) -> int:
+        return int(self._offsets[idx + 1] - self._offsets[idx])
+
+    def __getitem__(self, idx: int):
+        tokens = self._ids[self._offsets[idx]:self._offsets[idx + 1]]
+        if self._prompt_offsets is not None:
+            return tokens, int(self._prompt_offsets[idx])
+        return tokens
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+def materialize_dataset(dataset, cache_dir: Path) -> TokenizedDataset:
+    """
+    Tokenize every sample once (via dataset.process) into cache_dir, unless a previous job already did.
+    """
+    if (cache_dir / "offsets.npy").exists():
+        print(f"Reusing tokenized dataset at {cache_dir}")
+        os.utime(cache_dir) # Recently used, as far as prune_dataset_cache is concerned
+        return TokenizedDataset(cache_dir)
+
+    tmp_dir = cache_dir.with_name(cache_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    offsets = [0]
+    prompt_offsets = []
+    with open(tmp_dir / "ids.bin", "wb") as f:
+        for i in range(len(dataset)):
+            item = dataset.process(dataset[i])
+            if isinstance(item, tuple):
+                item, prompt_offset = item
+                prompt_offsets.append(prompt_offset)
+            tokens = np.asarray(item, dtype=np.int32)
+            f.write(tokens.tobytes())
+            offsets.append(offsets[-1] + len(tokens))
+
+    np.save(tmp_dir / "offsets.npy", np.asarray(offsets, dtype=np.int64))
+    if prompt_offsets:
+        np.save(tmp_dir / "prompt_offsets.npy", np.asarray(prompt_offsets, dtype=np.int64))
+
+    # Publish atomically so a crashed job never leaves a half-written cache behind
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    print(f"Tokenized {len(dataset)} samples ({offsets[-1]} tokens) to {cache_dir}")
+    return TokenizedDataset(cache_dir)
+
+def prune_dataset_cache(cache_root: Path, keep: Iterable[str] = (), max_bytes: int = DATASET_CACHE_MAX_BYTES):
+    """
+    Remove the least recently used tokenized datasets under cache_root until it fits max_bytes.
+    Entries named in keep (the running job's) and half-written .tmp directories are left alone.
+    """
+    keep = set(keep)
+    entries = []
+    try:
+        with os.scandir(cache_root) as it:
+            for entry in it:
+                if not entry.is_dir(follow_symlinks=False) or entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    with os.scandir(entry.path) as files:
+                        size = sum(f.stat().st_size for f in files if f.is_file(follow_symlinks=False))
+                    entries.append((entry.stat().st_mtime, size, entry.name))
+                except OSError:
+                    continue # Removed while we looked (another job pruning)
+    except FileNotFoundError:
+        return
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        shutil.rmtree(cache_root / name, ignore_errors=True)
+        total -= size
+        print(f"Removed tokenized dataset {name} from the cache")
+
+def bucket_lengths(max_seq_length: int):
+    buckets = []
+    length = MIN_BUCKET_LENGTH
+    while length < max_seq_length:
+        buckets.append(length)
+        length *= 2
+    buckets.append(max_seq_length)
+    return buckets
+
+def bucketed_iterate_batches(max_seq_length: int):
+    """
+    Wraps mlx_lm's iterate_batches so every batch is padded up to a power-of-two
+    bucket (64, 128, ... max_seq_length). The compiled training step then only
+    sees a handful of shapes. Padding is masked out of the loss by the lengths
+    array mlx_lm yields alongside each batch.
+    """
+    buckets = bucket_lengths(max_seq_length)
+
+    def iterate(*args, **kwargs):
+        for batch, lengths in iterate_batches(*args, **kwargs):
+            width = batch.shape[1]
+            target = next((b for b in buckets if b >= width), width)
+            if target > width:
+                batch = mx.pad(batch, [(0, 0), (0, target - width)])
+            yield batch, lengths
+
+    return iterate
@@ -1,23 +1,90 @@
 import asyncio
+import json
 import os
+import shutil
+import sys
 import threading
-from typing import Dict, Any, List
+import time
+import traceback
+import uuid
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from pathlib import Path
-from mlx_lm import load, generate
+import mlx.core as mx
+import mlx.optimizers as optim
+from mlx.utils import tree_flatten
+from huggingface_hub import snapshot_download
+from huggingface_hub.utils import tqdm as hf_tqdm
+from jinja2 import TemplateError
+from mlx_lm import load, stream_generate
 from mlx_lm.tuner import train, TrainingArgs
-from mlx_lm.utils import load_adapters
+from mlx_lm.tuner.datasets import load_local_dataset, create_dataset, CacheDataset
+from mlx_lm.tuner.utils import linear_to_lora_layers
+from mlx_lm.utils import load_adapters, quantize_model
 
 from app.engine.base import BaseEngineService
+from app.engine.jobs import JobRegistry
+from app.engine.model_store import ModelStore
+from app.engine.prompt_cache import PromptCachePool
+from app.engine.mlx_batching import ContinuousBatcher, CONTINUOUS_BATCHING
+from app.engine.mlx_datasets import bucketed_iterate_batches, dataset_cache_key, materialize_dataset, prune_dataset_cache
+
+# Models kept resident in unified memory before the least recently used is unloaded
+MAX_LOADED_MODELS = int(os.getenv("MLX_MAX_LOADED_MODELS", 2))
+
+# Run weights in float16: on Apple silicon it beats bfloat16 and float32 (half the bytes of fp32).
+# Set MLX_FLOAT16=0 for bf16-native models whose activations overflow in fp16.
+FORCE_FLOAT16 = os.getenv("MLX_FLOAT16", "1") != "0"
+
+# QLoRA base quantization
+QLORA_GROUP_SIZE = 64
+QLORA_BITS = 4
+
+# How long one models_dir scan answers status polls
+DOWNLOADED_SCAN_TTL = 1.0
+
+# Parallel file fetches per model download
+DOWNLOAD_MAX_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
+# Concurrent fine-tuning jobs; extra jobs wait in the queue instead of oversubscribing unified memory
+MAX_TRAINING_JOBS = int(os.getenv("MLX_MAX_TRAINING_JOBS", 1))
+
+# Reply length cap for chat generations
+MAX_NEW_TOKENS = 200
+
+# Prompt budget in tokens; defaults to the model's context window minus the reply
+MAX_PROMPT_TOKENS = int(os.getenv("MLX_MAX_PROMPT_TOKENS", 0))
+
+# Rendered + tokenized prompts kept for repeated message lists (retries, regenerate)
+PROMPT_TOKEN_CACHE_SIZE = 64
 
 class MLXEngineService(BaseEngineService):
     def __init__(self):
-        self.active_jobs = {}
+        self.active_jobs = JobRegistry()
+        self.train_pool = ThreadPoolExecutor(max_workers=max(1, MAX_TRAINING_JOBS), thread_name_prefix="mlx-train")
         self.active_downloads = set() # Track active downloads logic
-        self.loaded_models = {}
+        self._downloads_lock = threading.Lock() # Download workers run on several threads
+        self.download_progress: Dict[str, int] = {} # model_id -> percent of files fetched
+        self._downloaded_scan = (0.0, frozenset()) # (monotonic time, dir names with a .completed marker)
+        self.loaded_models = OrderedDict() # model_id -> (model, tokenizer), LRU order
+        self._model_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.max_loaded_models = max(1, MAX_LOADED_MODELS)
+        self._prompt_token_cache = OrderedDict() # (model_id, messages key) -> token ids
+        self._prompt_token_lock = threading.Lock() # Prompts are fitted on executor threads
+        self.prompt_caches = PromptCachePool() # Reusable KV caches across chat turns
+        self.batchers: Dict[str, ContinuousBatcher] = {} # model_id -> decode loop shared by concurrent chats
+        self._singles: Dict[str, int] = defaultdict(int) # model_id -> single-path chats in flight
+        self._singles_done: Dict[str, asyncio.Event] = defaultdict(asyncio.Event) # set when _singles drops to 0
+        self._in_use: Dict[str, int] = defaultdict(int) # model_id -> chat requests in progress
         self.models_dir = Path("models")
         self.models_dir.mkdir(exist_ok=True)
         self.adapters_dir = Path("adapters")
         self.adapters_dir.mkdir(exist_ok=True)
+        self._sweep_deleted_dirs(self.models_dir)
+        self._sweep_deleted_dirs(self.adapters_dir)
+        self.dataset_cache_dir = Path("dataset_cache") # Tokenized training sets, reused across jobs
 
         # PROD FIX: Check multiple locations for models.json
         possible_paths = [
@@ -26,7 +93,6 @@ class MLXEngineService(BaseEngineService):
         ]
 
         # Check sys._MEIPASS if frozen
-        import sys
         if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
              possible_paths.append(Path(sys._MEIPASS) / "models.json")
 
@@ -37,55 +103,31 @@ class MLXEngineService(BaseEngineService):
                 print(f"Found models.config at: {p.absolute()}")
                 break
 
-        self.models_config = self._load_models_config()
+        # models.db is the source of truth; models.json only seeds it with the bundled catalog
+        self.model_store = ModelStore(Path("models.db"), seed_path=self.models_config_path)
+        self.models_config = self.model_store.all() # In-memory copy, kept in step with every write
+        self.models_config_version = 0 # Bumped on every change, for callers caching derived data
+        self._reindex_names()
 
-    def _load_models_config(self):
-        # Load directly from models.json as the source of truth
-        if self.models_config_path.exists():
-            try:
-                with open(self.models_config_path, "r") as f:
-                    import json
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading models.json: {e}")
-                return []
-        else:
-            return []
+    def _models_changed(self):
+        self.models_config_version += 1
+        self._reindex_names()
+        self._invalidate_models_status()
 
-    def _save_models_config(self):
-        with open(self.models_config_path, "w") as f:
-            import json
-            json.dump(self.models_config, f, indent=4)
+    def _reindex_names(self):
+        # name -> id, so register_model's duplicate check doesn't scan the catalog
+        self._name_index: Dict[str, str] = {m["name"]: m["id"] for m in self.models_config}
 
     def get_supported_models(self):
         return self.models_config
 
-    def _get_dir_size_str(self, path: Path):
-        try:
-            total_size = 0
-            for dirpath, dirnames, filenames in os.walk(path):
-                for f in filenames:
-                    fp = os.path.join(dirpath, f)
-                    # skip if it is symbolic link
-                    if not os.path.islink(fp):
-                        total_size += os.path.getsize(fp)
-
-            gb = total_size / (1024 * 1024 * 1024)
-            if gb < 1:
-                return f"{gb:.2f}GB"
-            return f"{gb:.1f}GB"
-        except Exception as e:
-            print(f"Error calculating size for {path}: {e}")
-            return "Unknown"
-
     def register_model(self, name: str, path: str, url: str = ""):
         """
         Registers a custom model.
         Path should be the absolute path to the local model folder.
         """
-        for m in self.models_config:
-             if m['name'] == name:
-                 raise ValueError(f"Model with name {name} already exists.")
+        if name in self._name_index:
+            raise ValueError(f"Model with name {name} already exists.")
 
         # Calculate size immediately
         size_str = self._get_dir_size_str(Path(path))
@@ -100,8 +142,9 @@ class MLXEngineService(BaseEngineService):
             "is_custom": True
         }
 
+        self.model_store.upsert(new_model)
         self.models_config.append(new_model)
-        self._save_models_config()
+        self._models_changed()
         return new_model
 
     def list_models(self):
@@ -109,109 +152,428 @@ class MLXEngineService(BaseEngineService):
         return self.models_config
 
     async def get_model_and_tokenizer(self, model_id: str):
-        if model_id not in self.loaded_models:
-            print(f"Loading model: {model_id}")
+        if model_id in self.loaded_models:
+            self.loaded_models.move_to_end(model_id)
+            return self.loaded_models[model_id]
+
+        # One loader per model: concurrent first requests wait for it instead of loading the weights twice
+        async with self._model_locks[model_id]:
+            if model_id not in self.loaded_models:
+                print(f"Loading model: {model_id}")
+
+                path_to_load = model_id
+                adapter_path = None
+
+                # Check if it's a known config first
+                config_entry = self._get_model_config_by_id(model_id)
+
+                if config_entry:
+                    if config_entry.get("is_finetuned"):
+                        # loading fine-tuned model: base + adapter
+                        path_to_load = config_entry["base_model"]
+                        adapter_path = config_entry["adapter_path"]
+                        print(f"Identified fine-tuned model. Base: {path_to_load}, Adapter: {adapter_path}")
+                    elif Path(config_entry["id"]).is_absolute():
+                         path_to_load = config_entry["id"]
+                    else:
+                        # Standard model, check for local download
+                        sanitized_name = model_id.replace("/", "--")
+                        local_path = self.models_dir / sanitized_name
+                        if (local_path / ".completed").exists():
+                             path_to_load = str(local_path)
+                else:
+                    # Fallback logic for raw IDs passed directly
+                    if Path(model_id).is_absolute() and Path(model_id).exists():
+                         path_to_load = model_id
+                    else:
+                        sanitized_name = model_id.replace("/", "--")
+                        local_path = self.models_dir / sanitized_name
+                        if (local_path / ".completed").exists():
+                            path_to_load = str(local_path)
+
+                print(f"Loading from: {path_to_load} (Adapter: {adapter_path})")
+
+                # This loads the model weights into memory. API calls might timeout if this takes too long.
+                # ideally this should be async or backgrounded, but for MVP we wait.
+                # Running in an executor to avoid blocking the event loop entirely
+                loop = asyncio.get_running_loop()
+
+                def load_model():
+                    if adapter_path:
+                        # Load with adapter
+                        model, tokenizer = load(path_to_load, adapter_path=adapter_path)
+                    else:
+                        model, tokenizer = load(path_to_load)
+                    self._cast_to_float16(model, path_to_load)
+                    # MLX is lazy; make sure every weight is resident before the first generate
+                    mx.eval(model.parameters())
+                    return model, tokenizer
+
+                model, tokenizer = await loop.run_in_executor(None, load_model)
+
+                self.loaded_models[model_id] = (model, tokenizer)
+                self._evict_loaded_models()
+            else:
+                self.loaded_models.move_to_end(model_id)
+            return self.loaded_models[model_id]
 
-            path_to_load = model_id
-            adapter_path = None
+    @staticmethod
+    def _cast_to_float16(model, label: str):
+        """
+        Cast floating-point weights to float16 in place. Quantized (integer) weights are left alone.
+        """
+        if not FORCE_FLOAT16:
+            return
+        dtypes = {p.dtype for _, p in tree_flatten(model.parameters()) if mx.issubdtype(p.dtype, mx.floating)}
+        if mx.float32 in dtypes:
+            print(f"Warning: {label} has float32 weights; casting to float16")
+        if dtypes - {mx.float16}:
+            model.set_dtype(mx.float16)
+
+    @contextmanager
+    def _using(self, model_id: str):
+        # Held for a whole chat request, from loading the model to the reply, so the model
+        # isn't evicted while its prompt is still being fitted
+        self._in_use[model_id] += 1
+        try:
+            yield
+        finally:
+            self._in_use[model_id] -= 1
+            if not self._in_use[model_id]:
+                self._evict_loaded_models()
+
+    def _is_busy(self, model_id: str) -> bool:
+        batcher = self.batchers.get(model_id)
+        return bool(self._in_use[model_id] or self._singles[model_id]) or (batcher is not None and batcher.busy)
+
+    def _evict_loaded_models(self):
+        # Skip the newest model and any with generations running (unloading would fail them);
+        # a pinned model is retried when its last generation finishes
+        for evicted_id in list(self.loaded_models)[:-1]:
+            if len(self.loaded_models) <= self.max_loaded_models:
+                break
+            if self._is_busy(evicted_id):
+                continue
+            del self.loaded_models[evicted_id]
+            self.prompt_caches.drop(evicted_id)
+            batcher = self.batchers.pop(evicted_id, None)
+            if batcher:
+                batcher.close()
+            print(f"Unloaded model: {evicted_id}")
+            # Hand the freed buffers back to the system instead of keeping them in MLX's pool
+            clear_cache = getattr(mx, "clear_cache", None) or mx.metal.clear_cache
+            clear_cache()
+
+    def _encode_prompt(self, model_id: str, tokenizer, messages: list) -> List[int]:
+        """
+        Render the chat template and tokenize it, memoized on the message contents.
+        Token ids go straight to mlx_lm so the prompt is never re-tokenized from a string.
+        """
+        try:
+            key = (model_id, tuple((m["role"], m["content"]) for m in messages))
+            hash(key)
+        except (KeyError, TypeError):
+            key = None # Non-string content (e.g. multimodal parts), skip the cache
+
+        if key is not None:
+            with self._prompt_token_lock:
+                if key in self._prompt_token_cache:
+                    self._prompt_token_cache.move_to_end(key)
+                    return self._prompt_token_cache[key]
+
+        # Simple prompt construction for MVP (chat template handling varies by model)
+        # Using tokenizer.apply_chat_template is preferred if supported.
+        if hasattr(tokenizer, "apply_chat_template"):
+            prompt_ids = list(tokenizer.apply_chat_template(messages, add_generation_prompt=True))
+        else:
+            # Fallback for models without chat template config
+            prompt_ids = tokenizer.encode(messages[-1]['content'])
+
+        if key is not None:
+            with self._prompt_token_lock:
+                self._prompt_token_cache[key] = prompt_ids
+                if len(self._prompt_token_cache) > PROMPT_TOKEN_CACHE_SIZE:
+                    self._prompt_token_cache.popitem(last=False)
+        return prompt_ids
+
+    @staticmethod
+    def _usage(prompt: List[int], completion_tokens: int, tokens_per_second: float = None) -> Dict[str, Any]:
+        # Counts come from the token ids we already have; nothing is re-tokenized
+        usage = {
+            "prompt_tokens": len(prompt),
+            "completion_tokens": completion_tokens,
+            "total_tokens": len(prompt) + completion_tokens,
+        }
+        if tokens_per_second is not None:
+            usage["tokens_per_second"] = round(tokens_per_second, 2)
+        return usage
+
+    def _prompt_budget(self, model) -> int:
+        context = getattr(getattr(model, "args", None), "max_position_embeddings", None)
+        budget = context - MAX_NEW_TOKENS if context else 0
+        if MAX_PROMPT_TOKENS > 0:
+            budget = min(budget, MAX_PROMPT_TOKENS) if budget > 0 else MAX_PROMPT_TOKENS
+        return budget
+
+    def _fit_prompt(self, model_id: str, model, tokenizer, messages: list) -> Tuple[List[int], int]:
+        """
+        Encode the conversation within the prompt budget, dropping the oldest turns
+        (never a leading system message or the latest turn) when it doesn't fit.
+        Returns (token ids, number of messages dropped). Blocking; async code goes
+        through _fit_prompts.
+        """
+        prompt = self._encode_prompt(model_id, tokenizer, messages)
+        budget = self._prompt_budget(model)
+        if budget <= 0 or len(prompt) <= budget:
+            return prompt, 0
+
+        head = messages[:1] if messages and messages[0].get("role") == "system" else []
+        turns = messages[len(head):]
+
+        # Cut only before a user turn: many templates reject a history that opens with the assistant.
+        # Fewest dropped turns that fit; encodes O(log n) times instead of once per turn
+        starts = [i for i in range(1, len(turns)) if turns[i].get("role") == "user"]
+        lo, hi, best = 0, len(starts) - 1, None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            candidate = self._encode_prompt(model_id, tokenizer, head + turns[starts[mid]:])
+            if len(candidate) <= budget:
+                best, hi = (candidate, starts[mid]), mid - 1
+            else:
+                lo = mid + 1
 
-            # Check if it's a known config first
-            config_entry = self._get_model_config_by_id(model_id)
+        if best is None:
+            raise ValueError(f"Latest message does not fit the {budget}-token prompt budget")
+        print(f"Prompt over budget ({len(prompt)} > {budget} tokens), dropped {best[1]} oldest messages")
+        return best
 
-            if config_entry:
-                if config_entry.get("is_finetuned"):
-                    # loading fine-tuned model: base + adapter
-                    path_to_load = config_entry["base_model"]
-                    adapter_path = config_entry["adapter_path"]
-                    print(f"Identified fine-tuned model. Base: {path_to_load}, Adapter: {adapter_path}")
-                elif Path(config_entry["id"]).is_absolute():
-                     path_to_load = config_entry["id"]
-                else:
-                    # Standard model, check for local download
-                    sanitized_name = model_id.replace("/", "--")
-                    local_path = self.models_dir / sanitized_name
-                    if (local_path / ".completed").exists():
-                         path_to_load = str(local_path)
-            else:
-                # Fallback logic for raw IDs passed directly
-                if Path(model_id).is_absolute() and Path(model_id).exists():
-                     path_to_load = model_id
-                else:
-                    sanitized_name = model_id.replace("/", "--")
-                    local_path = self.models_dir / sanitized_name
-                    if (local_path / ".completed").exists():
-                        path_to_load = str(local_path)
+    async def _fit_prompts(self, model_id: str, model, tokenizer, conversations: List[list]) -> list:
+        """
+        _fit_prompt for each conversation, on the default executor: an over-budget prompt renders
+        the chat template several times, which would stall every other request on the event loop.
+        A conversation that can't be fitted gets its exception in place of the (ids, dropped) pair.
+        """
+        def fit_all():
+            fitted = []
+            for messages in conversations:
+                try:
+                    fitted.append(self._fit_prompt(model_id, model, tokenizer, messages))
+                except (ValueError, TemplateError) as e:
+                    fitted.append(e)
+            return fitted
 
-            print(f"Loading from: {path_to_load} (Adapter: {adapter_path})")
+        return await asyncio.get_running_loop().run_in_executor(None, fit_all)
 
-            # This loads the model weights into memory. API calls might timeout if this takes too long.
-            # ideally this should be async or backgrounded, but for MVP we wait.
-            # Running in an executor to avoid blocking the event loop entirely
-            loop = asyncio.get_running_loop()
+    def _stream_tokens(self, model_id: str, model, tokenizer, prompt: List[int], max_tokens: int = MAX_NEW_TOKENS):
+        """
+        Blocking generator over mlx_lm responses. Resumes from the KV cache of an
+        earlier turn so only new tokens are prefilled, and hands the cache back when done.
+        """
+        cache, remaining = self.prompt_caches.fetch(model_id, model, prompt)
+        tokens = []
+        for response in stream_generate(model, tokenizer, remaining, max_tokens=max_tokens, prompt_cache=cache):
+            # generate_step feeds each token through the model before handing it out, so every
+            # response's token is in the cache, the final one included (EOS on "stop", the
+            # token that hit max_tokens on "length")
+            tokens.append(response.token)
+            yield response
+        self.prompt_caches.store(model_id, prompt + tokens, cache)
+
+    async def _route(self, model_id: str, model, tokenizer, shared: bool = False) -> Optional[ContinuousBatcher]:
+        """
+        The decode loop a chat must join, or None if it may run alone on the single path (which
+        resumes from the conversation's KV cache). Once chats overlap on a model, because the caller
+        is a batch or a single-path generation is still running, every later chat goes through the
+        decode loop, which first waits for those single-path generations: the two never touch the
+        model at the same time. On None the caller must call _run_single before its next await.
+        """
+        if not CONTINUOUS_BATCHING:
+            return None
+        batcher = self.batchers.get(model_id)
+        if batcher is None and not shared and not self._singles[model_id]:
+            return None
+        if batcher is None or batcher.error is not None:
+            batcher = self.batchers[model_id] = ContinuousBatcher(model, tokenizer, on_idle=self._evict_loaded_models)
+        while self._singles[model_id]:
+            await self._singles_done[model_id].wait()
+        return batcher
+
+    def _run_single(self, model_id: str, fn: Callable) -> asyncio.Future:
+        """
+        Run a single-path generation on the default executor. The model counts as busy until the
+        thread returns, even when the request waiting on it is cancelled first.
+        """
+        self._singles[model_id] += 1
+        self._singles_done[model_id].clear()
 
-            if adapter_path:
-                 # Load with adapter
-                 model, tokenizer = await loop.run_in_executor(
-                    None,
-                    lambda: load(path_to_load, adapter_path=adapter_path)
-                )
-            else:
-                model, tokenizer = await loop.run_in_executor(None, load, path_to_load)
+        def release(_):
+            self._singles[model_id] -= 1
+            if not self._singles[model_id]:
+                self._singles_done[model_id].set()
+                self._evict_loaded_models()
 
-            self.loaded_models[model_id] = (model, tokenizer)
-        return self.loaded_models[model_id]
+        job = asyncio.get_running_loop().run_in_executor(None, fn)
+        job.add_done_callback(release)
+        return job
 
-    async def generate_response(self, model_id: str, messages: list):
-        try:
+    @staticmethod
+    async def _stream_batched(batcher: ContinuousBatcher, tokenizer, prompt: List[int]):
+        """
+        Text segments of a reply decoded by the batcher. The reply so far (at most MAX_NEW_TOKENS)
+        is re-decoded on every token; an incomplete multi-byte character is held back.
+        """
+        tokens, sent = [], ""
+        async for token in batcher.stream(prompt, max_tokens=MAX_NEW_TOKENS):
+            tokens.append(token)
+            text = tokenizer.decode(tokens)
+            if len(text) > len(sent) and not text.endswith("\ufffd"):
+                yield text[len(sent):]
+                sent = text
+        text = tokenizer.decode(tokens)
+        if len(text) > len(sent):
+            yield text[len(sent):]
+
+    def _batched_reply(self, tokenizer, prompt: List[int], truncated: int, tokens: List[int]) -> Dict[str, Any]:
+        return {
+            "role": "assistant",
+            "content": tokenizer.decode(tokens),
+            "usage": self._usage(prompt, len(tokens)),
+            "messages_truncated": truncated
+        }
+
+    async def stream_response(self, model_id: str, messages: list):
+        with self._using(model_id):
             model, tokenizer = await self.get_model_and_tokenizer(model_id)
+            fitted, = await self._fit_prompts(model_id, model, tokenizer, [messages])
+            if isinstance(fitted, Exception):
+                raise fitted
+            prompt, _ = fitted
+
+            batcher = await self._route(model_id, model, tokenizer)
+            if batcher is not None:
+                async for text in self._stream_batched(batcher, tokenizer, prompt):
+                    yield text
+                return
+
+            # Decode on a worker thread and hand text segments to the event loop as they arrive
+            loop = asyncio.get_running_loop()
+            queue = asyncio.Queue()
+            cancelled = threading.Event()
+            done = object()
 
-            # Simple prompt construction for MVP (chat template handling varies by model)
-            # For simplicity, we just concatenate or use apply_chat_template if available.
-            # Using tokenizer.apply_chat_template is preferred if supported.
-            if hasattr(tokenizer, "apply_chat_template"):
-                prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-            else:
-                 # Fallback for models without chat template config
-                prompt = messages[-1]['content']
+            def pump():
+                try:
+                    for response in self._stream_tokens(model_id, model, tokenizer, prompt):
+                        if cancelled.is_set():
+                            break
+                        if response.text:
+                            loop.call_soon_threadsafe(queue.put_nowait, response.text)
+                except Exception as e:
+                    loop.call_soon_threadsafe(queue.put_nowait, e)
+                finally:
+                    loop.call_soon_threadsafe(queue.put_nowait, done)
+
+            self._run_single(model_id, pump)
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is done:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                # Client went away (or we finished); stop decoding
+                cancelled.set()
 
-            # Run generation in executor
-            loop = asyncio.get_running_loop()
-            response_text = await loop.run_in_executor(
-                None,
-                lambda: generate(model, tokenizer, prompt=prompt, max_tokens=200, verbose=True)
-            )
+    async def generate_response(self, model_id: str, messages: list):
+        with self._using(model_id):
+            try:
+                model, tokenizer = await self.get_model_and_tokenizer(model_id)
+                fitted, = await self._fit_prompts(model_id, model, tokenizer, [messages])
+                if isinstance(fitted, Exception):
+                    raise fitted
+                prompt, truncated = fitted
+
+                batcher = await self._route(model_id, model, tokenizer)
+                if batcher is not None:
+                    tokens = await batcher.submit(prompt, max_tokens=MAX_NEW_TOKENS)
+                    return self._batched_reply(tokenizer, prompt, truncated, tokens)
+
+                def run_gen():
+                    parts, last = [], None
+                    for last in self._stream_tokens(model_id, model, tokenizer, prompt):
+                        parts.append(last.text)
+                    return "".join(parts), last
+
+                # Run generation in executor; shielded so a cancelled request doesn't release the model early
+                response_text, last = await asyncio.shield(self._run_single(model_id, run_gen))
+
+                return {
+                    "role": "assistant",
+                    "content": response_text,
+                    "usage": self._usage(prompt, last.generation_tokens if last else 0,
+                                         last.generation_tps if last else None),
+                    "messages_truncated": truncated
+                }
+            except Exception as e:
+                print(f"Generation error: {e}")
+                return {"role": "assistant", "content": f"Error generating response: {str(e)}"}
+
+    async def generate_response_batch(self, model_id: str, batch: List[list]):
+        if not CONTINUOUS_BATCHING or len(batch) == 1:
+            # Nothing to share a decode step with; generate_response picks the path
+            return await super().generate_response_batch(model_id, batch)
+        with self._using(model_id):
+            try:
+                model, tokenizer = await self.get_model_and_tokenizer(model_id)
 
-            return {
-                "role": "assistant",
-                "content": response_text,
-                "usage": {"total_tokens": len(response_text)} # Placeholder usage
-            }
-        except Exception as e:
-            print(f"Generation error: {e}")
-            return {"role": "assistant", "content": f"Error generating response: {str(e)}"}
+                fitted = await self._fit_prompts(model_id, model, tokenizer, batch)
+
+                batcher = await self._route(model_id, model, tokenizer, shared=True)
+
+                async def submit(item):
+                    if isinstance(item, Exception):
+                        raise item
+                    return await batcher.submit(item[0], max_tokens=MAX_NEW_TOKENS)
+
+                results = await asyncio.gather(*(submit(item) for item in fitted), return_exceptions=True)
+
+                responses = []
+                for item, result in zip(fitted, results):
+                    if isinstance(result, Exception):
+                        print(f"Batch generation error: {result}")
+                        responses.append({"role": "assistant", "content": f"Error generating response: {str(result)}"})
+                        continue
+                    prompt, truncated = item
+                    responses.append(self._batched_reply(tokenizer, prompt, truncated, result))
+                return responses
+            except Exception as e:
+                print(f"Batch generation error: {e}")
+                return [{"role": "assistant", "content": f"Error generating response: {str(e)}"} for _ in batch]
 
     async def start_finetuning(self, job_id: str, config: Dict[str, Any]):
         job_name = config.get("job_name", "")
         print(f"DEBUG SERVICE: start_finetuning job_name='{job_name}' for job_id={job_id}")
-        self.active_jobs[job_id] = {
-            "status": "starting",
-            "progress": 0,
-            "job_name": job_name,
-            "job_id": job_id # Store ID as well for easy access
-        }
+        self.active_jobs.create(
+            job_id,
+            status="queued",
+            progress=0,
+            job_name=job_name,
+            job_id=job_id # Store ID as well for easy access
+        )
 
-        # Spawn a thread for training so we don't block the API
-        thread = threading.Thread(target=self._run_training_job, args=(job_id, config))
-        thread.start()
+        # Train on the bounded pool so we don't block the API; later jobs wait their turn
+        self.train_pool.submit(self._run_training_job, job_id, config)
 
         return {"job_id": job_id, "status": "started", "job_name": job_name}
 
     def _run_training_job(self, job_id: str, config: Dict):
         """
-        Executed in a separate thread.
+        Executed on the training pool.
         """
         try:
-            self.active_jobs[job_id]["status"] = "training"
+            self.active_jobs.update(job_id, status="training")
             model_id = config.get("model_id")
             dataset_path = config.get("dataset_path")
             epochs = int(config.get("epochs", 3))
@@ -224,6 +586,7 @@ class MLXEngineService(BaseEngineService):
             max_seq_length = int(config.get("max_seq_length", 512))
             lora_dropout = float(config.get("lora_dropout", 0.0))
             lora_layers = int(config.get("lora_layers", 8))
+            quantize = bool(config.get("quantize", False))
 
             # Create dedicated directory for this job
             job_adapter_dir = self.adapters_dir / job_id
@@ -238,14 +601,20 @@ class MLXEngineService(BaseEngineService):
             # For efficiency we could reuse, but freezing/lora modification happens in-place.
             # RENAME config -> model_config to avoid shadowing the function argument 'config'
             model, tokenizer, model_config = load(model_id, return_config=True)
+            # Frozen base runs in float16; LoRA adapters added below stay float32 as master weights
+            # (LoRALinear casts its output back to the activation dtype, so activations stay fp16)
+            self._cast_to_float16(model, model_id)
+
+            # QLoRA: 4-bit base weights halve the bytes each step reads; adapters stay full precision
+            if quantize and "quantization" not in model_config:
+                print(f"Quantizing base model to {QLORA_BITS}-bit for QLoRA...")
+                model, model_config = quantize_model(model, model_config, QLORA_GROUP_SIZE, QLORA_BITS)
+                mx.eval(model.parameters())
 
             # Freeze the base model
             model.freeze()
 
             # 2. Setup Training Arguments
-            from mlx_lm.tuner.datasets import load_local_dataset, CacheDataset
-            import shutil
-
             # Fix: load_local_dataset expects a directory containing 'train.jsonl'.
             # It ignores the filename of dataset_path if we just pass the parent directory.
             # We must create a temporary directory for this job and copy the user's file to 'train.jsonl' there.
@@ -284,7 +653,6 @@ class MLXEngineService(BaseEngineService):
                     val_raw = raw_data[split_idx:]
 
                     # Re-create datasets
-                    from mlx_lm.tuner.datasets import create_dataset
                     train_set = create_dataset(train_raw, tokenizer, model_config)
                     val_set = create_dataset(val_raw, tokenizer, model_config)
                 else:
@@ -295,9 +663,20 @@ class MLXEngineService(BaseEngineService):
                     val_set = train_set
 
             # IMPORTANT: ChatDataset returns raw dicts. Trainer expects processed tuples.
-            # We must wrap them in CacheDataset which calls .process()
-            train_set = CacheDataset(train_set)
-            val_set = CacheDataset(val_set)
+            # Tokenize once into a memmap (reused by later jobs on the same data + model);
+            # fall back to CacheDataset, which calls .process() lazily
+            same_split = val_set is train_set
+            try:
+                train_key = dataset_cache_key(dataset_path, model_id, "train", len(train_set))
+                val_key = train_key if same_split else dataset_cache_key(dataset_path, model_id, "valid", len(val_set))
+                tokenized_train = materialize_dataset(train_set, self.dataset_cache_dir / train_key)
+                tokenized_val = tokenized_train if same_split else materialize_dataset(val_set, self.dataset_cache_dir / val_key)
+                train_set, val_set = tokenized_train, tokenized_val
+                prune_dataset_cache(self.dataset_cache_dir, keep=(train_key, val_key))
+            except Exception as e:
+                print(f"Could not pre-tokenize dataset, tokenizing lazily: {e}")
+                train_set = CacheDataset(train_set)
+                val_set = train_set if same_split else CacheDataset(val_set)
 
             # Calculate total iterations
             # Steps per epoch = len(train_set) / batch_size
@@ -320,7 +699,7 @@ class MLXEngineService(BaseEngineService):
                     if "iteration" in train_info:
                         step = train_info["iteration"]
                         prog = int((step / args.iters) * 100)
-                        self.active_jobs[job_id]["progress"] = prog
+                        self.active_jobs.update(job_id, progress=prog)
 
                 def on_val_loss_report(self_, val_info):
                     # We can log validation loss if we want, or just ignore
@@ -333,12 +712,9 @@ class MLXEngineService(BaseEngineService):
             # train(model, optimizer, train_dataset, val_dataset, args, training_callback=...)
 
             # We need to construction the optimizer
-            import mlx.optimizers as optim
             optimizer = optim.Adam(learning_rate=lr)
 
             # We need to convert to LoRA
-            from mlx_lm.tuner.utils import linear_to_lora_layers
-
             # Define LoRA config
             # Use user-defined layers count
 
@@ -364,12 +740,11 @@ class MLXEngineService(BaseEngineService):
                 train_dataset=train_set,
                 val_dataset=val_set,
                 args=args,
+                iterate_batches=bucketed_iterate_batches(max_seq_length),
                 training_callback=progress_callback
             )
 
-            self.active_jobs[job_id]["status"] = "completed"
-            self.active_jobs[job_id]["model_path"] = str(adapter_file)
-            self.active_jobs[job_id]["progress"] = 100
+            self.active_jobs.update(job_id, status="completed", model_path=str(adapter_file), progress=100)
 
             # --- Auto-Register Fine-Tuned Model ---
             job_name = config.get("job_name")
@@ -411,7 +786,6 @@ class MLXEngineService(BaseEngineService):
             }
 
             try:
-                import json
                 # Save metadata
                 with open(metadata_path, 'w') as f:
                     json.dump(metadata, f, indent=4)
@@ -440,19 +814,19 @@ class MLXEngineService(BaseEngineService):
                     "learning_rate": lr,
                     "max_seq_len": max_seq_length,
                     "dropout": lora_dropout,
-                    "lora_layers": lora_layers
+                    "lora_layers": lora_layers,
+                    "quantize": quantize
                 }
             }
+            self.model_store.upsert(ft_model_entry)
             self.models_config.append(ft_model_entry)
-            self._save_models_config()
+            self._models_changed()
             print(f"Registered fine-tuned model: {ft_model_entry['name']}")
 
         except Exception as e:
-            import traceback
             traceback.print_exc()
             print(f"Training failed: {e}")
-            self.active_jobs[job_id]["status"] = "failed"
-            self.active_jobs[job_id]["error"] = str(e)
+            self.active_jobs.update(job_id, status="failed", error=str(e))
 
     def get_job_status(self, job_id: str):
         return self.active_jobs.get(job_id, {"status": "not_found"})
@@ -468,8 +842,36 @@ class MLXEngineService(BaseEngineService):
         Returns the list of supported models with their local download status.
         Uses self.models_config which includes custom registered models.
         """
-        models = []
-        for m in self.models_config:
+        return self._cached_models_status()
+
+    def _downloaded_dirs(self) -> frozenset:
+        """
+        Names of completed downloads in models_dir, from one scandir shared by polls within DOWNLOADED_SCAN_TTL.
+        """
+        scanned_at, names = self._downloaded_scan
+        now = time.monotonic()
+        if now - scanned_at < DOWNLOADED_SCAN_TTL:
+            return names
+        try:
+            with os.scandir(self.models_dir) as it:
+                names = frozenset(e.name for e in it
+                                  if e.is_dir() and os.path.exists(os.path.join(e.path, ".completed")))
+        except FileNotFoundError:
+            names = frozenset()
+        self._downloaded_scan = (now, names)
+        return names
+
+    def _invalidate_models_status(self):
+        super()._invalidate_models_status()
+        self._downloaded_scan = (0.0, frozenset())
+
+    def iter_models_status(self):
+        """
+        Yields each model's status entry, one filesystem check at a time.
+        """
+        downloaded = self._downloaded_dirs()
+        # Snapshot so a concurrent register/delete can't disturb a streaming consumer
+        for m in list(self.models_config):
             # Check if model exists locally
 
             is_downloaded = False
@@ -496,16 +898,16 @@ class MLXEngineService(BaseEngineService):
             else:
                 # 2. Standard Downloaded Model
                 sanitized_name = m["id"].replace("/", "--")
-                local_path = self.models_dir / sanitized_name
                 # Only check for follow-up .completed file
-                if (local_path / ".completed").exists():
+                if sanitized_name in downloaded:
                     is_downloaded = True
-                    model_path = str(local_path)
+                    model_path = str(self.models_dir / sanitized_name)
 
             entry = {
                 **m,
                 "downloaded": is_downloaded,
                 "downloading": is_downloading,
+                "download_progress": self.download_progress.get(m["id"], 0) if is_downloading else None,
                 "local_path": model_path
             }
 
@@ -517,31 +919,40 @@ class MLXEngineService(BaseEngineService):
                     adapter_file = Path(m["adapter_path"])
                     meta_path = adapter_file.parent / "metadata.json"
                     if meta_path.exists():
-                        import json
                         with open(meta_path, 'r') as f:
                             meta = json.load(f)
                             if "job_name" in meta and meta["job_name"]:
                                 entry["name"] = meta["job_name"]
-                                # Optional: update config in memory to persist next save
                                 m["name"] = meta["job_name"]
+                                self._name_index[m["name"]] = m["id"]
+                                self.model_store.upsert(m)
                 except Exception:
                     pass
 
-            models.append(entry)
-        return models
+            yield entry
 
     def download_model(self, model_id: str):
         """
         Downloads a model to the local models directory.
         This is a blocking operation (run in Bg Task), handles markers.
         """
-        if model_id in self.active_downloads:
-            print(f"Model {model_id} already downloading.")
-            return
-
-        self.active_downloads.add(model_id)
+        with self._downloads_lock:
+            if model_id in self.active_downloads:
+                print(f"Model {model_id} already downloading.")
+                return
+            self.active_downloads.add(model_id)
+        self._invalidate_models_status()
+
+        self.download_progress[model_id] = 0
         try:
-            from huggingface_hub import snapshot_download
+            progress = self.download_progress
+
+            class DownloadProgress(hf_tqdm):
+                # snapshot_download ticks this once per finished file
+                def update(self_, n=1):
+                    super().update(n)
+                    if self_.total:
+                        progress[model_id] = int(self_.n * 100 / self_.total)
 
             print(f"Downloading {model_id} to {self.models_dir}...")
             sanitized_name = model_id.replace("/", "--")
@@ -556,12 +967,17 @@ class MLXEngineService(BaseEngineService):
                 repo_id=model_id,
                 local_dir=local_dir,
                 local_dir_use_symlinks=False,
-                # Force allowing patterns if needed? Default is all.
+                max_workers=DOWNLOAD_MAX_WORKERS, # Fetch shards in parallel
+                etag_timeout=30,
+                tqdm_class=DownloadProgress,
             )
 
-            # Write marker file
-            with open(marker_file, 'w') as f:
+            # Write marker file atomically so a crash can't leave a half-written marker
+            tmp_marker = local_dir / ".completed.tmp"
+            with open(tmp_marker, 'w') as f:
                 f.write("ok")
+            os.replace(tmp_marker, marker_file)
+            self._invalidate_models_status()
 
             print(f"Successfully downloaded {model_id}")
             return True
@@ -570,6 +986,29 @@ class MLXEngineService(BaseEngineService):
             raise e
         finally:
             self.active_downloads.discard(model_id)
+            self.download_progress.pop(model_id, None)
+            self._invalidate_models_status()
+
+    def _remove_dir(self, path: Path):
+        """
+        Delete a model or adapter directory. Directly under models_dir or adapters_dir it is renamed
+        to a hidden sibling (instant, same filesystem) and unlinked on a background thread, so the
+        caller returns right away; the startup sweep finishes deletes a restart interrupted. Folders
+        anywhere else (user-registered models) are removed in place, so no hidden copy can be left
+        behind in a directory the sweep never visits.
+        """
+        if path.parent.resolve() not in (self.models_dir.resolve(), self.adapters_dir.resolve()):
+            shutil.rmtree(path)
+            return
+        doomed = path.with_name(f".{path.name}.deleting-{uuid.uuid4().hex[:8]}")
+        os.rename(path, doomed)
+        threading.Thread(target=shutil.rmtree, args=(doomed,), kwargs={"ignore_errors": True}, daemon=True).start()
+
+    @staticmethod
+    def _sweep_deleted_dirs(parent: Path):
+        # Leftovers from deletes interrupted by a restart
+        for leftover in parent.glob(".*.deleting-*"):
+            threading.Thread(target=shutil.rmtree, args=(leftover,), kwargs={"ignore_errors": True}, daemon=True).start()
 
     def delete_model(self, model_id: str):
         """
@@ -584,25 +1023,24 @@ class MLXEngineService(BaseEngineService):
                 print(f"Deleting custom model: {model_id} ({config_entry['name']})")
 
                 # 1. Remove from config
+                self.model_store.delete(model_id)
                 self.models_config = [m for m in self.models_config if m["id"] != model_id]
-                self._save_models_config()
+                self._models_changed()
 
                 # 2. Delete files if it's a fine-tune (adapter path)
                 if config_entry.get("is_finetuned") and "adapter_path" in config_entry:
                     adapter_path = Path(config_entry["adapter_path"])
                     if adapter_path.exists() and adapter_path.is_dir():
-                        import shutil
                         print(f"Removing adapter directory: {adapter_path}")
-                        shutil.rmtree(adapter_path)
+                        self._remove_dir(adapter_path)
 
                 # 3. Delete files if it's a User Added Foundation Model (Absolute Path)
                 elif Path(model_id).is_absolute() and Path(model_id).exists():
                      target_path = Path(model_id)
                      # SAFETY CHECK: Only delete if path contains 'models' to prevent system damage
                      if "models" in str(target_path).lower() and target_path.is_dir():
-                         import shutil
                          print(f"Removing user model directory: {target_path}")
-                         shutil.rmtree(target_path)
+                         self._remove_dir(target_path)
                      else:
                          print(f"Skipping disk deletion for safety (not in 'models' folder?): {target_path}")
 
@@ -614,8 +1052,8 @@ class MLXEngineService(BaseEngineService):
 
             if local_dir.exists():
                 print(f"Deleting foundation model {model_id} at {local_dir}")
-                import shutil
-                shutil.rmtree(local_dir)
+                self._remove_dir(local_dir)
+                self._invalidate_models_status()
                 return True
             else:
                 print(f"Model {model_id} not found at {local_dir}")
@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List
+
+import orjson
+
+class ModelStore:
+    """
+    The model catalog in SQLite (models.db). A register, delete or finished fine-tune writes one
+    row instead of rewriting the whole catalog file. Rows come back in insertion order, and each
+    keeps the full models.json entry as JSON, so callers see the same dicts as before.
+
+    The bundled models.json seeds the table. Seeded ids are remembered, so each catalog entry is
+    inserted at most once: models shipped in an app update show up, but a deleted model (or a
+    custom entry migrated from an old models.json) doesn't come back on the next start.
+    """
+    def __init__(self, db_path: Path, seed_path: Path = None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS models ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " id TEXT NOT NULL UNIQUE,"
+            " name TEXT NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS models_name ON models(name)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS seeded_ids (id TEXT PRIMARY KEY)")
+        if seed_path is not None:
+            self._seed(seed_path)
+
+    def _seed(self, seed_path: Path):
+        if not seed_path.exists():
+            return
+        try:
+            with open(seed_path, "rb") as f:
+                entries = orjson.loads(f.read())
+        except Exception as e:
+            print(f"Error loading {seed_path}: {e}")
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                seeded = {row[0] for row in self._conn.execute("SELECT id FROM seeded_ids")}
+                new = [m for m in entries if m["id"] not in seeded]
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO models (id, name, data) VALUES (?, ?, ?)",
+                    [(m["id"], m["name"], orjson.dumps(m).decode()) for m in new],
+                )
+                self._conn.executemany("INSERT OR IGNORE INTO seeded_ids (id) VALUES (?)", [(m["id"],) for m in new])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM models ORDER BY seq").fetchall()
+        return [orjson.loads(data) for (data,) in rows]
+
+    def upsert(self, entry: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO models (id, name, data) VALUES (?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET name = excluded.name, data = excluded.data",
+                (entry["id"], entry["name"], orjson.dumps(entry).decode()),
+            )
+
+    def delete(self, model_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM models WHERE id = ?", (model_id,))
@@ -0,0 +1,165 @@
+import hashlib
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from mlx_lm.models.cache import KVCache, make_prompt_cache, can_trim_prompt_cache, trim_prompt_cache
+
+# Total KV bytes kept across all idle caches, and how many conversations to remember
+PROMPT_CACHE_MAX_BYTES = int(os.getenv("MLX_PROMPT_CACHE_BYTES", 2 * 1024 ** 3))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("MLX_PROMPT_CACHE_ENTRIES", 8))
+# Prefixes are indexed in blocks of this many tokens
+PREFIX_BLOCK_TOKENS = int(os.getenv("MLX_PREFIX_BLOCK_TOKENS", 32))
+
+def _common_prefix_len(a: List[int], b: List[int]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+def _block_digests(model_id: str, tokens: List[int], block: int = PREFIX_BLOCK_TOKENS) -> List[bytes]:
+    """
+    Cumulative blake2b digest at every full block boundary, so digest i identifies tokens[:(i + 1) * block].
+    """
+    hasher = hashlib.blake2b(model_id.encode(), digest_size=16)
+    digests = []
+    for start in range(0, len(tokens) - block + 1, block):
+        hasher.update(array("q", tokens[start:start + block]).tobytes())
+        digests.append(hasher.copy().digest())
+    return digests
+
+def _copy_prefix(cache, length: int) -> Optional[list]:
+    """
+    Fresh cache holding the first `length` positions of `cache`, or None if the layers can't be sliced.
+    MLX arrays are copy-on-write, so the source cache is left untouched.
+    """
+    copied = []
+    for layer in cache:
+        if type(layer) is not KVCache or layer.keys is None:
+            return None
+        keys, values = layer.state
+        fresh = KVCache()
+        fresh.state = (keys[..., :length, :], values[..., :length, :])
+        copied.append(fresh)
+    return copied
+
+def _cache_offset(cache) -> Optional[int]:
+    return getattr(cache[0], "offset", None) if cache else None
+
+def _cache_nbytes(cache) -> int:
+    total = 0
+    for layer in cache:
+        state = layer.state
+        arrays = state if isinstance(state, (list, tuple)) else [state]
+        total += sum(getattr(a, "nbytes", 0) for a in arrays)
+    return total
+
+class _Entry:
+    __slots__ = ("model_id", "tokens", "cache", "nbytes", "digests")
+
+    def __init__(self, model_id: str, tokens: List[int], cache: list):
+        self.model_id = model_id
+        self.tokens = tokens
+        self.cache = cache
+        self.nbytes = _cache_nbytes(cache)
+        self.digests = _block_digests(model_id, tokens)
+
+class PromptCachePool:
+    """
+    Idle KV caches from finished generations, matched to new prompts by token prefix.
+    A follow-up chat turn re-renders the whole history, so its prompt shares a long
+    prefix with the previous turn's prompt + reply; only the new suffix is prefilled.
+    Entries are indexed by block hashes of their tokens. A cache that is wholly a
+    prefix of the prompt is checked out exclusively; a partial match (e.g. a shared
+    system prompt) gets a copy of the matching positions and the entry stays pooled.
+    """
+    def __init__(self, max_bytes: int = PROMPT_CACHE_MAX_BYTES, max_entries: int = PROMPT_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._index: Dict[bytes, Set[int]] = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, model_id: str, model, prompt: List[int]) -> Tuple[list, List[int]]:
+        """
+        Returns (prompt_cache, tokens_still_to_process) for the prompt.
+        """
+        digests = _block_digests(model_id, prompt)
+        with self._lock:
+            # Longest block-aligned hit, then extend token by token among its entries
+            best_key, best_len = None, 0
+            for digest in reversed(digests):
+                keys = self._index.get(digest)
+                if keys:
+                    for key in keys:
+                        common = _common_prefix_len(self._entries[key].tokens, prompt)
+                        if common > best_len:
+                            best_key, best_len = key, common
+                    break
+
+            if best_key is not None:
+                entry = self._entries[best_key]
+                # Always leave at least one token to run through the model
+                common = min(best_len, len(prompt) - 1)
+                if common == len(entry.tokens):
+                    self._remove(best_key)
+                    return entry.cache, prompt[common:]
+                shared = _copy_prefix(entry.cache, common)
+                if shared is not None:
+                    self._entries.move_to_end(best_key)
+                    return shared, prompt[common:]
+                if can_trim_prompt_cache(entry.cache):
+                    self._remove(best_key)
+                    trim_prompt_cache(entry.cache, len(entry.tokens) - common)
+                    return entry.cache, prompt[common:]
+
+        return make_prompt_cache(model), prompt
+
+    def store(self, model_id: str, tokens: List[int], cache: list):
+        """
+        Return a cache after generation. tokens is everything fed through it (prompt + reply).
+        """
+        offset = _cache_offset(cache)
+        if offset is not None and offset != len(tokens):
+            if offset < len(tokens):
+                tokens = tokens[:offset]
+            elif can_trim_prompt_cache(cache):
+                trim_prompt_cache(cache, offset - len(tokens))
+            else:
+                return # Cache holds tokens we can't account for
+
+        entry = _Entry(model_id, list(tokens), cache)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = entry
+            for digest in entry.digests:
+                self._index.setdefault(digest, set()).add(key)
+            self._evict()
+
+    def drop(self, model_id: str):
+        """
+        Forget every cache for a model (e.g. when it is unloaded).
+        """
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.model_id == model_id]:
+                self._remove(key)
+
+    def _remove(self, key: int) -> _Entry:
+        entry = self._entries.pop(key)
+        for digest in entry.digests:
+            keys = self._index.get(digest)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[digest]
+        return entry
+
+    def _evict(self):
+        total = sum(e.nbytes for e in self._entries.values())
+        while self._entries and (len(self._entries) > self.max_entries or total > self.max_bytes):
+            total -= self._remove(next(iter(self._entries))).nbytes
@@ -4,12 +4,22 @@ from app.engine.factory import get_engine
 class MLXEngineService:
     def __init__(self):
         # Delegate everything to the factory service
-        pass
+        # name -> bound method of the service active when it was looked up
+        object.__setattr__(self, "_methods", {})
 
     def __getattr__(self, name):
         service = get_engine()
         if service:
-            return getattr(service, name)
+            # Reuse the bound method while the engine is unchanged; after an engine switch
+            # the lookup goes to the new service (and the old one's method is dropped)
+            method = self._methods.get(name)
+            if method is not None and method.__self__ is service:
+                return method
+            attr = getattr(service, name)
+            # Data attributes (e.g. models_config) are reassigned by the service, so only methods are kept
+            if getattr(attr, "__self__", None) is service:
+                self._methods[name] = attr
+            return attr
         raise AttributeError(f"Engine service not initialized. Attribute {name} not found.")
 
 # Define a curated list of supported models for the UI
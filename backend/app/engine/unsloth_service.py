@@ -1,10 +1,30 @@
 import asyncio
+import hashlib
+import multiprocessing as mp
 import os
+import queue
+import shutil
+import sys
 import threading
+import traceback
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List
 from pathlib import Path
 import torch
+try:
+    import hf_transfer  # noqa: F401
+    # Rust multi-connection downloader for large shards. Must be set before huggingface_hub is imported.
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+except ImportError:
+    pass
+from huggingface_hub import snapshot_download, list_repo_files
+import orjson
 from app.engine.base import BaseEngineService
+from app.engine.jobs import JobRegistry
+from app.engine.model_store import ModelStore
+from app.engine.hf_prompt_cache import HFPromptCachePool
 
 # Unsloth specific imports
 try:
@@ -12,6 +32,7 @@ try:
     from trl import SFTTrainer
     from transformers import TrainingArguments
     from datasets import load_dataset
+    from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
 except (ImportError, NotImplementedError, RuntimeError) as e:
     # Allow import for factory even if deps missing (will be checked by factory)
     # Unsloth raises NotImplementedError/RuntimeError if no GPU found on import
@@ -20,12 +41,64 @@ except (ImportError, NotImplementedError, RuntimeError) as e:
     SFTTrainer = None
     TrainingArguments = None
     load_dataset = None
+    TextIteratorStreamer = None
+    StoppingCriteria = object
+    StoppingCriteriaList = None
+
+# Opt-in: static KV cache + torch.compile'd forward (CUDA-graph decode). Costs a compile on
+# first load and replaces the cross-turn prefix cache, which needs a croppable dynamic cache.
+STATIC_KV_CACHE = os.getenv("UNSLOTH_STATIC_CACHE", "0") == "1"
+
+DOWNLOAD_MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+# Rendered chat prompts kept per (model, conversation)
+PROMPT_RENDER_CACHE_SIZE = 128
+
+# Processes SFTTrainer uses to tokenize (and pack) the training set
+DATASET_NUM_PROC = max(2, (os.cpu_count() or 4) // 2)
+
+# Duplicate weight formats skipped when a repo also ships safetensors (which is what we load)
+DUPLICATE_WEIGHT_PATTERNS = ["*.bin", "*.pt", "*.pth", "*.ckpt", "*.h5", "*.msgpack", "*.onnx", "*.onnx_data"]
+
+@contextmanager
+def _inference_context():
+    """
+    No autograd bookkeeping (version counters, view tracking) during generation, and autocast
+    any stray fp32 ops to the half precision Unsloth computes in.
+    """
+    dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    with torch.inference_mode(), torch.autocast("cuda", dtype=dtype):
+        yield
+
+def _to_cuda(inputs):
+    """
+    Move tokenizer output to the GPU from pinned memory, asynchronously. generate runs on the same
+    stream, so its kernels are ordered after the copy without an explicit sync.
+    """
+    for key, value in inputs.items():
+        inputs[key] = value.pin_memory().to("cuda", non_blocking=True)
+    return inputs
+
+class _CancelledCriteria(StoppingCriteria):
+    """Stops a streaming generate once its client has disconnected."""
+    def __init__(self, cancelled: threading.Event):
+        self.cancelled = cancelled
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.cancelled.is_set()
 
 class UnslothEngineService(BaseEngineService):
     def __init__(self):
-        self.active_jobs = {}
+        self.active_jobs = JobRegistry()
         self.active_downloads = set()
+        self._downloads_lock = threading.Lock()
         self.loaded_models = {}
+        self._model_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.prompt_caches = HFPromptCachePool() # Reusable KV caches across chat turns
+        # All GPU work (loads, generations) queues on one thread: requests serialize instead of
+        # interleaving on CUDA, and don't take threads from the shared default pool
+        self._gen_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="unsloth-gen")
+        self._rendered_prompts: "OrderedDict[tuple, str]" = OrderedDict()
 
         # Dedicated directories for Unsloth to avoid conflict with MLX
         self.models_dir = Path("models/unsloth")
@@ -43,7 +116,6 @@ class UnslothEngineService(BaseEngineService):
             Path("models.json"),
             Path("_internal/models.json"),
         ]
-        import sys
         if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
              possible_paths.append(Path(sys._MEIPASS) / "models.json")
 
@@ -53,48 +125,25 @@ class UnslothEngineService(BaseEngineService):
                 self.models_config_path = p
                 break
 
-        self.models_config = self._load_models_config()
+        # models.db is the source of truth; models.json only seeds it with the bundled catalog
+        self.model_store = ModelStore(Path("models.db"), seed_path=self.models_config_path)
+        self.models_config = self.model_store.all()
+        self._reindex_names()
 
-    def _load_models_config(self):
-        if self.models_config_path.exists():
-            try:
-                with open(self.models_config_path, "r") as f:
-                    import json
-                    return json.load(f)
-            except Exception as e:
-                print(f"Error loading models.json: {e}")
-                return []
-        else:
-            return []
+    def _models_changed(self):
+        self._reindex_names()
+        self._invalidate_models_status()
 
-    def _save_models_config(self):
-        with open(self.models_config_path, "w") as f:
-            import json
-            json.dump(self.models_config, f, indent=4)
+    def _reindex_names(self):
+        # name -> id, so register_model's duplicate check doesn't scan the catalog
+        self._name_index: Dict[str, str] = {m["name"]: m["id"] for m in self.models_config}
 
     def get_supported_models(self):
         return self.models_config
 
-    def _get_dir_size_str(self, path: Path):
-        try:
-            total_size = 0
-            for dirpath, dirnames, filenames in os.walk(path):
-                for f in filenames:
-                    fp = os.path.join(dirpath, f)
-                    if not os.path.islink(fp):
-                        total_size += os.path.getsize(fp)
-
-            gb = total_size / (1024 * 1024 * 1024)
-            if gb < 1:
-                return f"{gb:.2f}GB"
-            return f"{gb:.1f}GB"
-        except Exception as e:
-            return "Unknown"
-
     def register_model(self, name: str, path: str, url: str = ""):
-        for m in self.models_config:
-             if m['name'] == name:
-                 raise ValueError(f"Model with name {name} already exists.")
+        if name in self._name_index:
+            raise ValueError(f"Model with name {name} already exists.")
 
         size_str = self._get_dir_size_str(Path(path))
 
@@ -109,230 +158,318 @@ class UnslothEngineService(BaseEngineService):
             "engine": "unsloth" # Mark as registered via unsloth if needed
         }
 
+        self.model_store.upsert(new_model)
         self.models_config.append(new_model)
-        self._save_models_config()
+        self._models_changed()
         return new_model
 
     def list_models(self):
         return self.models_config
 
     async def get_model_and_tokenizer(self, model_id: str):
-        if model_id not in self.loaded_models:
-            print(f"Loading Unsloth model: {model_id}")
+        if model_id in self.loaded_models:
+            return self.loaded_models[model_id]
 
-            # 1. Determine path
-            path_to_load = model_id
+        # One loader per model: concurrent first requests wait for it instead of loading twice
+        async with self._model_locks[model_id]:
+            if model_id not in self.loaded_models:
+                print(f"Loading Unsloth model: {model_id}")
 
-            # Check if local download exists
-            sanitized_name = model_id.replace("/", "--")
-            local_path = self.models_dir / sanitized_name
-            if (local_path / ".completed").exists():
-                path_to_load = str(local_path)
+                # 1. Determine path
+                path_to_load = model_id
 
-            # 2. Load using FastLanguageModel
-            # Note: Unsloth loads model + tokenizer
-            # Run in executor to avoid blocking
-            loop = asyncio.get_running_loop()
-
-            def load_unsloth():
-                model, tokenizer = FastLanguageModel.from_pretrained(
-                    model_name=path_to_load,
-                    max_seq_length=2048, # Default max seq length
-                    dtype=None,
-                    load_in_4bit=True, # Default to 4bit for efficiency as requested
-                )
-                FastLanguageModel.for_inference(model) # Optimize for inference
-                return model, tokenizer
-
-            model, tokenizer = await loop.run_in_executor(None, load_unsloth)
-            self.loaded_models[model_id] = (model, tokenizer)
-
-        return self.loaded_models[model_id]
+                # Check if local download exists
+                sanitized_name = model_id.replace("/", "--")
+                local_path = self.models_dir / sanitized_name
+                if (local_path / ".completed").exists():
+                    path_to_load = str(local_path)
+
+                # 2. Load using FastLanguageModel
+                # Note: Unsloth loads model + tokenizer
+                # Run in executor to avoid blocking
+                loop = asyncio.get_running_loop()
+
+                def load_unsloth():
+                    model, tokenizer = FastLanguageModel.from_pretrained(
+                        model_name=path_to_load,
+                        max_seq_length=2048, # Default max seq length
+                        dtype=None,
+                        load_in_4bit=True, # Default to 4bit for efficiency as requested
+                    )
+                    FastLanguageModel.for_inference(model) # Optimize for inference
+                    if STATIC_KV_CACHE:
+                        self._compile_static_decode(model, tokenizer)
+                    return model, tokenizer
+
+                model, tokenizer = await loop.run_in_executor(self._gen_executor, load_unsloth)
+                self.loaded_models[model_id] = (model, tokenizer)
+
+            return self.loaded_models[model_id]
+
+    @staticmethod
+    def _compile_static_decode(model, tokenizer):
+        """
+        Fixed-shape decode: a static KV cache lets torch.compile capture the forward as a CUDA graph.
+        Falls back to the dynamic cache if compilation fails for this architecture.
+        """
+        eager_forward = model.forward
+        try:
+            model.generation_config.cache_implementation = "static"
+            model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=True)
+            # Compile now rather than on the first user request
+            warmup = tokenizer(["Hello"], return_tensors="pt").to("cuda")
+            model.generate(**warmup, max_new_tokens=2)
+            print("Compiled static-cache decode")
+        except Exception as e:
+            print(f"Static cache compile failed, using dynamic cache: {e}")
+            model.forward = eager_forward
+            model.generation_config.cache_implementation = None
 
     async def generate_response(self, model_id: str, messages: list):
         try:
             model, tokenizer = await self.get_model_and_tokenizer(model_id)
 
             # Convert messages to prompt
-            # Unsloth usually relies on tokenizer chat template
-            if hasattr(tokenizer, "apply_chat_template"):
-                prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-            else:
-                prompt = messages[-1]['content']
+            prompt = self._render_prompt(model_id, tokenizer, messages)
 
             loop = asyncio.get_running_loop()
 
             def run_gen():
-                inputs = tokenizer([prompt], return_tensors="pt").to("cuda")
-                outputs = model.generate(**inputs, max_new_tokens=200, use_cache=True)
+                inputs, outputs = self._generate(model_id, model, tokenizer, prompt)
+                prompt_len = inputs.input_ids.shape[1]
                 # Decode only the new tokens
-                response = tokenizer.batch_decode(outputs[:, inputs.input_ids.shape[1]:], skip_special_tokens=True)[0]
-                return response
+                response = tokenizer.batch_decode(outputs.sequences[:, prompt_len:], skip_special_tokens=True)[0]
+                return response, self._usage(prompt_len, outputs.sequences.shape[1] - prompt_len)
 
-            response_text = await loop.run_in_executor(None, run_gen)
+            response_text, usage = await loop.run_in_executor(self._gen_executor, run_gen)
 
             return {
                 "role": "assistant",
                 "content": response_text,
-                "usage": {"total_tokens": len(response_text)}
+                "usage": usage
             }
         except Exception as e:
             print(f"Unsloth Generation error: {e}")
             return {"role": "assistant", "content": f"Error generating response: {str(e)}"}
 
-    async def start_finetuning(self, job_id: str, config: Dict[str, Any]):
-        job_name = config.get("job_name", "")
-        self.active_jobs[job_id] = {
-            "status": "starting",
-            "progress": 0,
-            "job_name": job_name,
-            "job_id": job_id
-        }
+    async def stream_response(self, model_id: str, messages: list):
+        model, tokenizer = await self.get_model_and_tokenizer(model_id)
+        prompt = self._render_prompt(model_id, tokenizer, messages)
 
-        thread = threading.Thread(target=self._run_training_job, args=(job_id, config))
-        thread.start()
+        # generate() runs on a worker thread and pushes decoded text into the streamer as tokens land
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        cancelled = threading.Event()
+        done = object()
 
-        return {"job_id": job_id, "status": "started", "job_name": job_name}
+        def pump():
+            try:
+                streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+                stop = StoppingCriteriaList([_CancelledCriteria(cancelled)])
+                errors = []
+
+                def run_gen():
+                    try:
+                        self._generate(model_id, model, tokenizer, prompt, streamer=streamer, stopping_criteria=stop)
+                    except Exception as e:
+                        errors.append(e)
+                        streamer.end() # Unblock the reader below
+
+                worker = threading.Thread(target=run_gen)
+                worker.start()
+                for text in streamer:
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+                worker.join()
+                if errors:
+                    raise errors[0]
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
 
-    def _run_training_job(self, job_id: str, config: Dict):
+        loop.run_in_executor(self._gen_executor, pump)
         try:
-            self.active_jobs[job_id]["status"] = "training"
-            model_id = config.get("model_id")
-            dataset_path = config.get("dataset_path")
-
-            # Params
-            epochs = int(config.get("epochs", 3))
-            lr = float(config.get("learning_rate", 2e-4))
-            batch_size = int(config.get("batch_size", 2)) # Unsloth handles batching well
-            lora_rank = int(config.get("lora_rank", 16))
-            lora_alpha = float(config.get("lora_alpha", 16))
-            max_seq_length = int(config.get("max_seq_length", 2048))
-            lora_dropout = float(config.get("lora_dropout", 0.0))
-
-            # Unsloth supports 4bit loading
-            load_in_4bit = True
-
-            job_adapter_dir = self.adapters_dir / job_id
-            job_adapter_dir.mkdir(parents=True, exist_ok=True)
-
-            print(f"Starting Unsloth training job {job_id}...")
-
-            # 1. Load Model
-            model, tokenizer = FastLanguageModel.from_pretrained(
-                model_name = model_id,
-                max_seq_length = max_seq_length,
-                dtype = None,
-                load_in_4bit = load_in_4bit,
-            )
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Client went away (or we finished); stop decoding
+            cancelled.set()
 
-            # 2. Add LoRA
-            model = FastLanguageModel.get_peft_model(
-                model,
-                r = lora_rank,
-                target_modules = ["q_proj", "k_proj", "v_proj", "o_proj",
-                                "gate_proj", "up_proj", "down_proj",],
-                lora_alpha = lora_alpha,
-                lora_dropout = lora_dropout,
-                bias = "none",
-                use_gradient_checkpointing = "unsloth",
-                random_state = 3407,
-                use_rslora = False,
-                loftq_config = None,
-            )
+    def _render_prompt(self, model_id: str, tokenizer, messages: list) -> str:
+        # Unsloth usually relies on tokenizer chat template
+        if not hasattr(tokenizer, "apply_chat_template"):
+            return messages[-1]['content']
 
-            # 3. Load Dataset
-            # Unsloth uses standard HF datasets.
-            # If dataset_path is local jsonl
-            if dataset_path.endswith(".jsonl") or dataset_path.endswith(".json"):
-                 dataset = load_dataset("json", data_files={"train": dataset_path}, split="train")
-            else:
-                 # Fallback/Assuming HF path?
-                 dataset = load_dataset(dataset_path, split="train")
-
-            # Standardize formatting (Simple assume 'text' field or convert chat format?)
-            # For MVP, assume the dataset has a "text" column or is chat format.
-            # Unsloth has standardization tools but simple is better here.
-
-            # 4. Trainer
-            trainer = SFTTrainer(
-                model = model,
-                tokenizer = tokenizer,
-                train_dataset = dataset,
-                dataset_text_field = "text", # Assumption for MVP
-                max_seq_length = max_seq_length,
-                dataset_num_proc = 2,
-                packing = False, # Can set True for speed
-                args = TrainingArguments(
-                    per_device_train_batch_size = batch_size,
-                    gradient_accumulation_steps = 4,
-                    warmup_steps = 5,
-                    max_steps = 60, # Demo default? Or calculate from epochs
-                    num_train_epochs = epochs,
-                    learning_rate = lr,
-                    fp16 = not torch.cuda.is_bf16_supported(),
-                    bf16 = torch.cuda.is_bf16_supported(),
-                    logging_steps = 1,
-                    optim = "adamw_8bit",
-                    weight_decay = 0.01,
-                    lr_scheduler_type = "linear",
-                    seed = 3407,
-                    output_dir = str(job_adapter_dir),
-                ),
-            )
+        # The Jinja render is pure Python and grows with the history; retries and repeated
+        # conversations reuse the last result. Keyed by a digest so histories aren't held twice.
+        try:
+            encoded = orjson.dumps(messages, option=orjson.OPT_SORT_KEYS)
+            key = (model_id, hashlib.blake2b(encoded, digest_size=16).digest())
+        except TypeError:
+            key = None # Not JSON-serializable; render uncached
+
+        if key is not None and key in self._rendered_prompts:
+            self._rendered_prompts.move_to_end(key)
+            return self._rendered_prompts[key]
+
+        prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        if key is not None:
+            self._rendered_prompts[key] = prompt
+            while len(self._rendered_prompts) > PROMPT_RENDER_CACHE_SIZE:
+                self._rendered_prompts.popitem(last=False)
+        return prompt
+
+    @staticmethod
+    def _usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
 
-            # Progress Callback Hook?
-            # Transformers callback is complex to inject into SFTTrainer simply without class definition.
-            # For MVP we might skip detailed progress bar updates or use a simple callback.
+    def _generate(self, model_id: str, model, tokenizer, prompt: str, **extra):
+        """
+        model.generate for one prompt, resuming from a cached KV prefix when there is one.
+        Returns (inputs, outputs); outputs is a generate dict with sequences and past_key_values.
+        """
+        with _inference_context():
+            inputs = _to_cuda(tokenizer([prompt], return_tensors="pt"))
+            gen_kwargs = {"max_new_tokens": 200, "use_cache": True, "return_dict_in_generate": True, **extra}
+            # Resume from an earlier turn's KV cache so only the new suffix is prefilled
+            # (static-cache models allocate their own cache inside generate)
+            static = getattr(model.generation_config, "cache_implementation", None) == "static"
+            cache = None if static else self.prompt_caches.fetch(model_id, inputs.input_ids[0])
+            if cache is not None:
+                gen_kwargs["past_key_values"] = cache
+            try:
+                outputs = model.generate(**inputs, **gen_kwargs)
+            except Exception as e:
+                if cache is None:
+                    raise
+                print(f"Cached prefix rejected, prefilling from scratch: {e}")
+                del gen_kwargs["past_key_values"]
+                outputs = model.generate(**inputs, **gen_kwargs)
+            if not static:
+                self.prompt_caches.store(model_id, outputs.sequences[0], outputs.past_key_values)
+        return inputs, outputs
+
+    async def generate_response_batch(self, model_id: str, batch: List[list]):
+        if len(batch) == 1:
+            return await super().generate_response_batch(model_id, batch)
+        try:
+            model, tokenizer = await self.get_model_and_tokenizer(model_id)
 
-            trainer.train()
+            prompts = [self._render_prompt(model_id, tokenizer, messages) for messages in batch]
 
-            # Save
-            model.save_pretrained(str(job_adapter_dir))
-            tokenizer.save_pretrained(str(job_adapter_dir))
+            loop = asyncio.get_running_loop()
 
-            self.active_jobs[job_id]["status"] = "completed"
-            self.active_jobs[job_id]["progress"] = 100
+            def run_gen():
+                # Decoder-only models need left padding so every row ends at the prompt boundary
+                tokenizer.padding_side = "left"
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+                inputs = _to_cuda(tokenizer(prompts, return_tensors="pt", padding=True))
+                with _inference_context():
+                    outputs = model.generate(**inputs, max_new_tokens=200, use_cache=True)
+                new_tokens = outputs[:, inputs.input_ids.shape[1]:]
+                texts = tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+                # Rows that stopped early are right-padded; padding isn't part of the reply
+                prompt_lens = inputs.attention_mask.sum(dim=1).tolist()
+                completion_lens = (new_tokens != tokenizer.pad_token_id).sum(dim=1).tolist()
+                return [(text, self._usage(p, c)) for text, p, c in zip(texts, prompt_lens, completion_lens)]
+
+            results = await loop.run_in_executor(self._gen_executor, run_gen)
+
+            return [
+                {"role": "assistant", "content": text, "usage": usage}
+                for text, usage in results
+            ]
+        except Exception as e:
+            print(f"Unsloth Batch Generation error: {e}")
+            return [{"role": "assistant", "content": f"Error generating response: {str(e)}"} for _ in batch]
 
-            # Save Metadata
-            metadata = {
-                "job_name": config.get("job_name", f"Unsloth-FT-{job_id[:8]}"),
-                "job_id": job_id,
-                "base_model": model_id,
-                "engine": "unsloth",
-                "params": config
-            }
-            with open(job_adapter_dir / "metadata.json", "w") as f:
-                import json
-                json.dump(metadata, f, indent=4)
-
-            # Register
-            ft_model_entry = {
-                "id": f"ft-unsloth-{job_id}",
-                "name": metadata["job_name"],
-                "base_model": model_id,
-                "adapter_path": str(job_adapter_dir),
-                "size": "Adapter",
-                "family": "Custom",
-                "is_custom": True,
-                "is_finetuned": True,
-                "engine": "unsloth"
-            }
-            self.models_config.append(ft_model_entry)
-            self._save_models_config()
+    async def start_finetuning(self, job_id: str, config: Dict[str, Any]):
+        job_name = config.get("job_name", "")
+        self.active_jobs.create(
+            job_id,
+            status="starting",
+            progress=0,
+            job_name=job_name,
+            job_id=job_id
+        )
+
+        ctx = mp.get_context("spawn") # fork would inherit the server's CUDA context
+        status_queue = ctx.Queue()
+        process = ctx.Process(
+            target=_training_process_main,
+            args=(job_id, config, str(self.adapters_dir / job_id), status_queue),
+        ) # Not a daemon: the datasets map with num_proc starts its own worker processes
+        process.start()
+        threading.Thread(target=self._watch_training_process, args=(job_id, process, status_queue), daemon=True).start()
 
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            print(f"Unsloth Training failed: {e}")
-            self.active_jobs[job_id]["status"] = "failed"
-            self.active_jobs[job_id]["error"] = str(e)
+        return {"job_id": job_id, "status": "started", "job_name": job_name}
+
+    def _watch_training_process(self, job_id: str, process, status_queue):
+        """
+        Apply a training process's status messages to active_jobs and register the adapter when it finishes.
+        """
+        while True:
+            try:
+                kind, payload = status_queue.get(timeout=1.0)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                try:
+                    # It may have posted its last message just before exiting
+                    kind, payload = status_queue.get_nowait()
+                except queue.Empty:
+                    # Killed without reporting (CUDA OOM abort, segfault, ...)
+                    print(f"Unsloth training process for {job_id} exited with code {process.exitcode}")
+                    self.active_jobs.update(job_id, status="failed", error=f"Training process exited with code {process.exitcode}")
+                    return
+
+            if kind == "update":
+                self.active_jobs.update(job_id, **payload)
+            elif kind == "failed":
+                self.active_jobs.update(job_id, status="failed", error=payload)
+                process.join()
+                return
+            elif kind == "completed":
+                self._register_finetuned(job_id, payload)
+                self.active_jobs.update(job_id, status="completed", progress=100)
+                process.join()
+                return
+
+    def _register_finetuned(self, job_id: str, metadata: Dict):
+        ft_model_entry = {
+            "id": f"ft-unsloth-{job_id}",
+            "name": metadata["job_name"],
+            "base_model": metadata["base_model"],
+            "adapter_path": str(self.adapters_dir / job_id),
+            "size": "Adapter",
+            "family": "Custom",
+            "is_custom": True,
+            "is_finetuned": True,
+            "engine": "unsloth"
+        }
+        self.model_store.upsert(ft_model_entry)
+        self.models_config.append(ft_model_entry)
+        self._models_changed()
 
     def get_job_status(self, job_id: str):
         return self.active_jobs.get(job_id, {"status": "not_found"})
 
     def get_models_status(self):
-        models = []
-        for m in self.models_config:
+        return self._cached_models_status()
+
+    def iter_models_status(self):
+        for m in list(self.models_config):
             # Filter? Or show all and mark engine compatibility?
             # For now show all, check download status in unsloth dir
 
@@ -353,14 +490,14 @@ class UnslothEngineService(BaseEngineService):
 
             # Add engine-specific flag if needed
             entry = {**m, "downloaded": is_downloaded, "downloading": is_downloading, "local_path": model_path}
-            models.append(entry)
-        return models
+            yield entry
 
     def download_model(self, model_id: str):
-        if model_id in self.active_downloads: return
-        self.active_downloads.add(model_id)
+        with self._downloads_lock:
+            if model_id in self.active_downloads: return
+            self.active_downloads.add(model_id)
+        self._invalidate_models_status()
         try:
-            from huggingface_hub import snapshot_download
             print(f"Downloading {model_id} to {self.models_dir} (Unsloth)...")
             sanitized_name = model_id.replace("/", "--")
             local_dir = self.models_dir / sanitized_name
@@ -369,7 +506,13 @@ class UnslothEngineService(BaseEngineService):
             if marker_file.exists(): os.remove(marker_file)
 
             # Download generic HF model (usually safetensors)
-            snapshot_download(repo_id=model_id, local_dir=local_dir, local_dir_use_symlinks=False)
+            snapshot_download(
+                repo_id=model_id,
+                local_dir=local_dir,
+                local_dir_use_symlinks=False,
+                max_workers=DOWNLOAD_MAX_WORKERS,
+                ignore_patterns=self._download_ignore_patterns(model_id),
+            )
 
             with open(marker_file, 'w') as f: f.write("ok")
             print(f"Successfully downloaded {model_id}")
@@ -379,6 +522,19 @@ class UnslothEngineService(BaseEngineService):
             raise e
         finally:
             self.active_downloads.discard(model_id)
+            self._invalidate_models_status()
+
+    @staticmethod
+    def _download_ignore_patterns(model_id: str):
+        # Dual-format repos carry every checkpoint twice; only skip the pickles if safetensors exist
+        try:
+            files = list_repo_files(model_id)
+        except Exception as e:
+            print(f"Could not list files for {model_id}, downloading everything: {e}")
+            return None
+        if any(f.endswith(".safetensors") for f in files):
+            return DUPLICATE_WEIGHT_PATTERNS
+        return None
 
     def delete_model(self, model_id: str):
         # Implementation similar to MLX but targeting unsloth dirs
@@ -386,7 +542,128 @@ class UnslothEngineService(BaseEngineService):
         sanitized_name = model_id.replace("/", "--")
         local_dir = self.models_dir / sanitized_name
         if local_dir.exists():
-            import shutil
             shutil.rmtree(local_dir)
+            self._invalidate_models_status()
             return True
         return False
+
+
+def _training_process_main(job_id: str, config: Dict, adapter_dir: str, status_queue):
+    """
+    Entry point of the spawned training process. Runs a whole Unsloth fine-tune outside the API
+    server (own GIL, own CUDA context) and reports back through status_queue as
+    ("update", fields), ("completed", metadata) or ("failed", error).
+    """
+    try:
+        status_queue.put(("update", {"status": "training"}))
+        model_id = config.get("model_id")
+        dataset_path = config.get("dataset_path")
+
+        # Params
+        epochs = int(config.get("epochs", 3))
+        lr = float(config.get("learning_rate", 2e-4))
+        batch_size = int(config.get("batch_size", 2)) # Unsloth handles batching well
+        lora_rank = int(config.get("lora_rank", 16))
+        lora_alpha = float(config.get("lora_alpha", 16))
+        max_seq_length = int(config.get("max_seq_length", 2048))
+        lora_dropout = float(config.get("lora_dropout", 0.0))
+
+        # Unsloth supports 4bit loading
+        load_in_4bit = True
+
+        job_adapter_dir = Path(adapter_dir)
+        job_adapter_dir.mkdir(parents=True, exist_ok=True)
+
+        print(f"Starting Unsloth training job {job_id}...")
+
+        # 1. Load Model
+        model, tokenizer = FastLanguageModel.from_pretrained(
+            model_name = model_id,
+            max_seq_length = max_seq_length,
+            dtype = None,
+            load_in_4bit = load_in_4bit,
+        )
+
+        # 2. Add LoRA
+        model = FastLanguageModel.get_peft_model(
+            model,
+            r = lora_rank,
+            target_modules = ["q_proj", "k_proj", "v_proj", "o_proj",
+                            "gate_proj", "up_proj", "down_proj",],
+            lora_alpha = lora_alpha,
+            lora_dropout = lora_dropout,
+            bias = "none",
+            use_gradient_checkpointing = "unsloth",
+            random_state = 3407,
+            use_rslora = False,
+            loftq_config = None,
+        )
+
+        # 3. Load Dataset
+        # Unsloth uses standard HF datasets.
+        # If dataset_path is local jsonl
+        if dataset_path.endswith(".jsonl") or dataset_path.endswith(".json"):
+             dataset = load_dataset("json", data_files={"train": dataset_path}, split="train")
+        else:
+             # Fallback/Assuming HF path?
+             dataset = load_dataset(dataset_path, split="train")
+
+        # Standardize formatting (Simple assume 'text' field or convert chat format?)
+        # For MVP, assume the dataset has a "text" column or is chat format.
+        # Unsloth has standardization tools but simple is better here.
+
+        # 4. Trainer
+        trainer = SFTTrainer(
+            model = model,
+            tokenizer = tokenizer,
+            train_dataset = dataset,
+            dataset_text_field = "text", # Assumption for MVP
+            max_seq_length = max_seq_length,
+            dataset_num_proc = DATASET_NUM_PROC,
+            # Concatenate short examples up to max_seq_length instead of padding each one (causal LM)
+            packing = True,
+            args = TrainingArguments(
+                per_device_train_batch_size = batch_size,
+                gradient_accumulation_steps = 4,
+                warmup_steps = 5,
+                max_steps = 60, # Demo default? Or calculate from epochs
+                num_train_epochs = epochs,
+                learning_rate = lr,
+                fp16 = not torch.cuda.is_bf16_supported(),
+                bf16 = torch.cuda.is_bf16_supported(),
+                logging_steps = 1,
+                optim = "adamw_8bit",
+                weight_decay = 0.01,
+                lr_scheduler_type = "linear",
+                seed = 3407,
+                output_dir = str(job_adapter_dir),
+            ),
+        )
+
+        # Progress Callback Hook?
+        # Transformers callback is complex to inject into SFTTrainer simply without class definition.
+        # For MVP we might skip detailed progress bar updates or use a simple callback.
+
+        trainer.train()
+
+        # Save
+        model.save_pretrained(str(job_adapter_dir))
+        tokenizer.save_pretrained(str(job_adapter_dir))
+
+        # Save Metadata
+        metadata = {
+            "job_name": config.get("job_name", f"Unsloth-FT-{job_id[:8]}"),
+            "job_id": job_id,
+            "base_model": model_id,
+            "engine": "unsloth",
+            "params": config
+        }
+        with open(job_adapter_dir / "metadata.json", "wb") as f:
+            f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+
+        status_queue.put(("completed", metadata))
+
+    except Exception as e:
+        traceback.print_exc()
+        print(f"Unsloth Training failed: {e}")
+        status_queue.put(("failed", str(e)))
@@ -1,23 +1,43 @@
 import psutil
 import platform
 import shutil
+import time
 
 class SystemMonitor:
-    @staticmethod
-    def get_system_stats():
+    # Seconds a stats snapshot is reused; the UI polls faster than these numbers change
+    STATS_TTL = 0.5
+
+    # Fixed for the life of the process, so read once
+    _STATIC = {
+        "cores": psutil.cpu_count(logical=True),
+        "platform": {
+            "system": platform.system(),
+            "processor": platform.processor(),
+            "release": platform.release()
+        }
+    }
+    _cache = {"ts": 0.0, "data": None}
+
+    @classmethod
+    def get_system_stats(cls):
+        now = time.monotonic()
+        if cls._cache["data"] is not None and now - cls._cache["ts"] < cls.STATS_TTL:
+            return cls._cache["data"]
+
         # RAM Usage
         mem = psutil.virtual_memory()
-        
+
         # Disk Usage (where the app runs)
         du = shutil.disk_usage(".")
-        
-        # CPU Usage
+
+        # CPU Usage since the previous call (non-blocking). The very first call has nothing to
+        # compare against and reports 0.0.
         cpu_percent = psutil.cpu_percent(interval=None)
-        
+
         # Basic GPU/Unified Mem heuristic (placeholder until MLX provides direct queries or via specialized tool)
         # On M-series, System RAM = VRAM mostly.
-        
-        return {
+
+        data = {
             "memory": {
                 "total": mem.total,
                 "available": mem.available,
@@ -32,11 +52,9 @@ class SystemMonitor:
             },
             "cpu": {
                 "percent": cpu_percent,
-                "cores": psutil.cpu_count(logical=True)
+                "cores": cls._STATIC["cores"]
             },
-            "platform": {
-                "system": platform.system(),
-                "processor": platform.processor(),
-                "release": platform.release()
-            }
+            "platform": cls._STATIC["platform"]
         }
+        cls._cache = {"ts": now, "data": data}
+        return data
@@ -1,24 +1,60 @@
-from presidio_analyzer import AnalyzerEngine, Registry
+from presidio_analyzer import AnalyzerEngine
 from presidio_anonymizer import AnonymizerEngine
-from typing import List, Dict
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+import copy
+import hashlib
+import logging
+import threading
 import spacy
 
+logger = logging.getLogger(__name__)
+
+# Max distinct (text, entities) analyses kept in memory
+ANALYZE_CACHE_SIZE = 10_000
+
+# spaCy components Presidio never reads. NER feeds the recognizers and the lemmas (tagger ->
+# attribute_ruler -> lemmatizer) feed context enhancement, but the dependency parse is unused.
+SPACY_DISABLED = ["parser"]
+
+# Analyzer results keyed by (blake2b digest of the text, entities). Module-level so it outlives
+# service instances without pinning them; digests keep the texts themselves out of memory.
+_analyze_cache: "OrderedDict[Tuple[bytes, Optional[Tuple[str, ...]]], tuple]" = OrderedDict()
+_analyze_cache_lock = threading.Lock()
+
+def _text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+_shield_service = None
+_shield_service_lock = threading.Lock()
+
+def get_shield_service() -> "PIIShieldService":
+    """
+    The process-wide PIIShieldService, built on first use. Loading spaCy and Presidio takes
+    seconds, so callers must share this instance rather than construct their own.
+    """
+    global _shield_service
+    if _shield_service is None:
+        with _shield_service_lock:
+            if _shield_service is None:
+                _shield_service = PIIShieldService()
+    return _shield_service
+
 class PIIShieldService:
     def __init__(self):
         # Initialize engines once (heavy model load)
-        print("DEBUG: Initializing PIIShieldService...", flush=True)
+        logger.debug("Initializing PIIShieldService...")
         try:
             # PROD FIX: Explicitly load the bundled spacy model
             # This works better with PyInstaller than relying on string names
             nlp = None
-            nlp = None
             try:
                 # 1. Try importing as module (standard)
                 import en_core_web_sm
-                print("DEBUG: Found en_core_web_sm module, loading...", flush=True)
-                nlp = en_core_web_sm.load()
+                logger.debug("Found en_core_web_sm module, loading...")
+                nlp = en_core_web_sm.load(disable=SPACY_DISABLED)
             except Exception as e1:
-                print(f"DEBUG: module load failed: {e1}", flush=True)
+                logger.debug("en_core_web_sm module load failed: %s", e1)
                 # 2. Try loading from sys._MEIPASS (PyInstaller)
                 import sys
                 import os
@@ -33,73 +69,87 @@ class PIIShieldService:
                         # Also check if it was collected into the root
                         model_path = os.path.join(base_path, "en_core_web_sm")
                         if os.path.exists(model_path):
-                             print(f"DEBUG: Loading from frozen path: {model_path}", flush=True)
-                             nlp = spacy.load(model_path)
+                             logger.debug("Loading from frozen path: %s", model_path)
+                             nlp = spacy.load(model_path, disable=SPACY_DISABLED)
                         else:
                              # Try typical site-packages structure if collected entirely
                              # But collect_all usually puts it in root.
                              # Let's try spacy.load("en_core_web_sm") again but maybe it needs context?
-                             print(f"DEBUG: Model path not found at {model_path}, trying spacy.load('en_core_web_sm')", flush=True)
-                             nlp = spacy.load("en_core_web_sm")
+                             logger.debug("Model path not found at %s, trying spacy.load('en_core_web_sm')", model_path)
+                             nlp = spacy.load("en_core_web_sm", disable=SPACY_DISABLED)
                     except Exception as e2:
-                         print(f"DEBUG: Frozen load failed: {e2}", flush=True)
+                         logger.debug("Frozen load failed: %s", e2)
 
             if nlp is None:
                  # 3. Last ditch: try loading generic 'en' using spacy
                  try:
-                    nlp = spacy.load("en_core_web_sm")
+                    nlp = spacy.load("en_core_web_sm", disable=SPACY_DISABLED)
                  except Exception as e3:
-                    print(f"DEBUG: All load attempts failed. Last error: {e3}", flush=True)
+                    logger.error("All spaCy load attempts failed. Last error: %s", e3)
             
             if nlp:
-                 print("DEBUG: Spacy NLP model loaded successfully.", flush=True)
-                 # Create a registry with this specific NLP engine
-                 from presidio_analyzer.nlp_engine import NlpEngineProvider
-                 
-                 # Configure Presidio to use this nlp object? 
-                 # Actually Presidio expects a config to create the engine.
-                 # But we can inject the nlp object if we subclass or use internal APIs.
-                 # EASIER: register it?
-                 
-                 # Official Presidio way with custom model:
-                 conf_file = {
-                    "nlp_engine_name": "spacy",
-                    "models": [{"lang_code": "en", "model_name": "en_core_web_sm"}]
-                 }
-                 # But we need to ensure 'en_core_web_sm' is linkable.
-                 # If 'en_core_web_sm' is imported as a module, spacy.load('en_core_web_sm') works IF listed in metadata.
-                 
-                 # Force the loaded nlp into spacy's util cache if needed?
-                 # No, AnalyzerEngine defaults to NlpEngineProvider(conf_file).create_engine()
-                 
-                 provider = NlpEngineProvider(nlp_configuration=conf_file)
-                 nlp_engine = provider.create_engine()
-                 
+                 logger.debug("Spacy NLP model loaded successfully.")
+                 # Wrap the pipeline we already loaded (unused components disabled). Going through
+                 # NlpEngineProvider would spacy.load the full model a second time.
+                 from presidio_analyzer.nlp_engine import SpacyNlpEngine
+
+                 nlp_engine = SpacyNlpEngine(models=[{"lang_code": "en", "model_name": "en_core_web_sm"}])
+                 nlp_engine.nlp = {"en": nlp} # is_loaded() is now true, so AnalyzerEngine won't load()
+
                  self.analyzer = AnalyzerEngine(nlp_engine=nlp_engine)
-                 print("DEBUG: AnalyzerEngine initialized with custom config.", flush=True)
+                 logger.debug("AnalyzerEngine initialized with custom config.")
                  
             else:
                  # Fallback to default (might crash if model missing)
-                 print("WARNING: No NLP model loaded. PIIShield will likely fail.", flush=True)
+                 logger.warning("No NLP model loaded. PIIShield will likely fail.")
                  self.analyzer = AnalyzerEngine() 
                  
             self.anonymizer = AnonymizerEngine()
-            print("DEBUG: PIIShieldService fully initialized.", flush=True)
+            logger.info("PIIShieldService initialized.")
             
         except Exception as e:
-            print(f"CRITICAL: Failed to init PIIShieldService: {e}", flush=True)
-            import traceback
-            traceback.print_exc()
+            logger.exception("Failed to init PIIShieldService: %s", e)
             # Don't crash the whole app, but PII will fail
             self.analyzer = None
             self.anonymizer = None
 
+    def warmup(self):
+        """
+        Run one analysis so Presidio builds its recognizers now instead of on the first request.
+        """
+        if not self.analyzer:
+            return
+        try:
+            self.analyze_text("John Doe lives in Paris.")
+            logger.debug("PIIShieldService warmed up.")
+        except Exception as e:
+            logger.warning("PIIShieldService warmup failed: %s", e)
+
+    def _analyze_with_cache(self, text: str, entities: List[str] = None):
+        # The same text is often analyzed repeatedly (analyze then anonymize, re-scans, repeated CSV values)
+        entities_key = tuple(sorted(entities)) if entities is not None else None
+        key = (_text_digest(text), entities_key)
+        with _analyze_cache_lock:
+            results = _analyze_cache.get(key)
+            if results is not None:
+                _analyze_cache.move_to_end(key)
+
+        if results is None:
+            results = tuple(self.analyzer.analyze(text=text, entities=entities, language='en'))
+            with _analyze_cache_lock:
+                _analyze_cache[key] = results
+                while len(_analyze_cache) > ANALYZE_CACHE_SIZE:
+                    _analyze_cache.popitem(last=False)
+
+        # Hand out copies so callers can't mutate cached results
+        return [copy.copy(result) for result in results]
+
     def analyze_text(self, text: str, entities: List[str] = None):
         """
         Analyze text for PII entities.
         """
         if not self.analyzer: raise ValueError("PII Shield not initialized")
-        results = self.analyzer.analyze(text=text, entities=entities, language='en')
+        results = self._analyze_with_cache(text, entities)
         return [result.to_dict() for result in results]
 
     def anonymize_text(self, text: str, entities: List[str] = None):
@@ -108,7 +158,7 @@ class PIIShieldService:
         """
         if not self.analyzer or not self.anonymizer: return {"text": text, "items": []}
         
-        analyzer_results = self.analyzer.analyze(text=text, entities=entities, language='en')
+        analyzer_results = self._analyze_with_cache(text, entities)
         anonymized_result = self.anonymizer.anonymize(
             text=text,
             analyzer_results=analyzer_results
@@ -1,9 +1,16 @@
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import orjson
+import asyncio
+import logging
 import os
 import sys
 
+logger = logging.getLogger(__name__)
+
 # DEBUG: Trace startup
 print("DEBUG: Starting main.py imports...", flush=True)
 
@@ -12,7 +19,8 @@ try:
     print("DEBUG: Imported monitor router", flush=True)
     from app.api.preparation import router as preparation_router
     print("DEBUG: Imported preparation router", flush=True)
-    from app.api.engine import router as engine_router
+    from app.api.engine import router as engine_router, download_pool
+    from app.engine.factory import EngineFactory, get_engine
     print("DEBUG: Imported engine router", flush=True)
 
 except Exception as e:
@@ -21,10 +29,20 @@ except Exception as e:
     traceback.print_exc()
     sys.exit(1)
 
+class OrjsonResponse(JSONResponse):
+    """
+    JSON responses serialized with orjson. Our handlers return plain dicts (no response models),
+    so FastAPI's Pydantic fast path doesn't apply; its own ORJSONResponse is deprecated in
+    current releases and warns on every request.
+    """
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
 app = FastAPI(
     title="Silicon Studio Backend",
     description="Local-first LLM fine-tuning engine",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=OrjsonResponse
 )
 
 # Configure CORS for local development
@@ -41,6 +59,37 @@ app.include_router(preparation_router, prefix="/api/preparation", tags=["prepara
 app.include_router(engine_router, prefix="/api/engine", tags=["engine"])
 
 
+@app.on_event("startup")
+async def preload_engine_config():
+    # Read engine_config.json once here so request handlers only hit the cache
+    EngineFactory.get_engine_config()
+    # Build the engine now so its heavy imports (mlx_lm, huggingface_hub, torch) are paid at startup,
+    # not by the first fine-tune or chat request
+    try:
+        await run_in_threadpool(get_engine)
+    except Exception as e:
+        print(f"Engine preload failed, will retry on first request: {e}", flush=True)
+
+@app.on_event("startup")
+async def warm_pii_shield():
+    # Load spaCy/Presidio in the background: /health answers right away, and a PII request that
+    # arrives first waits on the singleton lock instead of loading a second copy
+    def warm():
+        try:
+            from app.shield.service import get_shield_service
+            get_shield_service().warmup()
+        except Exception:
+            logger.exception("PII shield warm-up failed")
+    asyncio.get_running_loop().run_in_executor(None, warm)
+
+@app.on_event("startup")
+async def start_download_workers():
+    download_pool.start()
+
+@app.on_event("shutdown")
+async def stop_download_workers():
+    await download_pool.stop()
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok", "service": "silicon-studio-engine"}
@@ -50,6 +99,17 @@ if __name__ == "__main__":
     multiprocessing.freeze_support()
     
     port = int(os.getenv("PORT", 8000))
-    # When frozen, we cannot use reload=True and should pass the app object directly
-    print(f"DEBUG: Uvicorn starting on port {port}", flush=True)
-    uvicorn.run(app, host="127.0.0.1", port=port, reload=False)
+    # Job, download and loaded-model state is per process, so more than one
+    # worker only suits stateless use (e.g. chat against preloaded models).
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    if workers > 1 and getattr(sys, "frozen", False):
+        # Worker processes re-import "main:app", which the PyInstaller bundle can't do
+        logger.warning("WEB_CONCURRENCY=%d ignored in the packaged app; running a single worker", workers)
+        workers = 1
+    print(f"DEBUG: Uvicorn starting on port {port} with {workers} worker(s)", flush=True)
+    if workers > 1:
+        # Multiple workers need an import string so each process can build its own app
+        uvicorn.run("main:app", host="127.0.0.1", port=port, workers=workers)
+    else:
+        # When frozen, we cannot use reload=True and should pass the app object directly
+        uvicorn.run(app, host="127.0.0.1", port=port, reload=False)
@@ -0,0 +1,93 @@
+import asyncio
+
+from app.engine.batching import BatchScheduler
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    async def dispatch(model_id, batch):
+        calls.append((model_id, len(batch)))
+        return [{"content": messages[-1]["content"]} for messages in batch]
+
+    async def main():
+        scheduler = BatchScheduler(dispatch, max_batch=4, max_latency_ms=50)
+        futures = [await scheduler.enqueue("m", [{"role": "user", "content": str(i)}]) for i in range(3)]
+        return await asyncio.gather(*futures)
+
+    results = run(main())
+    assert [r["content"] for r in results] == ["0", "1", "2"]
+    assert calls == [("m", 3)]
+
+def test_short_result_list_fails_the_remaining_requests():
+    async def dispatch(model_id, batch):
+        return [{"content": "only one"}]
+
+    async def main():
+        scheduler = BatchScheduler(dispatch, max_batch=4, max_latency_ms=50)
+        futures = [await scheduler.enqueue("m", [{"role": "user", "content": "hi"}]) for _ in range(3)]
+        return await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), 1)
+
+    first, *rest = run(main())
+    assert first == {"content": "only one"}
+    assert all(isinstance(r, RuntimeError) for r in rest)
+
+def test_dispatch_error_reaches_every_caller():
+    async def dispatch(model_id, batch):
+        raise ValueError("boom")
+
+    async def main():
+        scheduler = BatchScheduler(dispatch, max_batch=2, max_latency_ms=50)
+        futures = [await scheduler.enqueue("m", [{"role": "user", "content": "hi"}]) for _ in range(2)]
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in run(main()))
+
+def test_idle_workers_are_reaped():
+    async def dispatch(model_id, batch):
+        return [{"content": "ok"} for _ in batch]
+
+    async def main():
+        scheduler = BatchScheduler(dispatch, max_latency_ms=1, idle_timeout=0.05)
+        for i in range(20):
+            await (await scheduler.enqueue(f"bogus-{i}", [{"role": "user", "content": "hi"}]))
+        assert len(scheduler.workers) == 20
+        await asyncio.sleep(0.2)
+        assert scheduler.workers == {} and scheduler.queues == {}
+
+        # A model that comes back gets a new worker
+        assert await (await scheduler.enqueue("bogus-0", [{"role": "user", "content": "again"}])) == {"content": "ok"}
+
+    run(main())
+
+def test_inflight_batches_are_capped_and_the_queue_pushes_back():
+    running, peak = 0, 0
+    release = None
+
+    async def dispatch(model_id, batch):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await release.wait()
+        running -= 1
+        return [{"content": "ok"} for _ in batch]
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        scheduler = BatchScheduler(dispatch, max_batch=1, max_latency_ms=1, queue_size=1, max_inflight=1)
+        futures = [await scheduler.enqueue("m", [{"role": "user", "content": "hi"}]) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        # One batch running, one request waiting in the full queue: the next caller has to wait
+        blocked = asyncio.ensure_future(scheduler.enqueue("m", [{"role": "user", "content": "hi"}]))
+        await asyncio.sleep(0.05)
+        assert not blocked.done() and len(scheduler.inflight) == 1
+
+        release.set()
+        futures.append(await blocked)
+        return await asyncio.gather(*futures)
+
+    assert run(main()) == [{"content": "ok"}] * 3
+    assert peak == 1
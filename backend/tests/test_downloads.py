@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.api.engine as engine_api
+from app.engine.downloads import DownloadWorkerPool, size_priority
+
+class FakeService:
+    def __init__(self):
+        self.release = threading.Event()
+        self.downloading = set()
+        self.models = [{"id": f"org/model-{i}", "name": f"Model {i}", "size": "1GB"} for i in range(3)]
+
+    def get_supported_models(self):
+        return self.models
+
+    def get_models_status(self):
+        return [{**m, "downloaded": False, "downloading": m["id"] in self.downloading} for m in self.models]
+
+    def iter_models_status(self):
+        yield from self.get_models_status()
+
+    def download_model(self, model_id):
+        self.downloading.add(model_id)
+        self.release.wait(5)
+        self.downloading.discard(model_id)
+
+@pytest.fixture
+def client(monkeypatch):
+    service = FakeService()
+    pool = DownloadWorkerPool(lambda: service, workers=1)
+    monkeypatch.setattr(engine_api, "get_service_or_raise", lambda: service)
+    monkeypatch.setattr(engine_api, "download_pool", pool)
+    app = FastAPI()
+    app.include_router(engine_api.router)
+    with TestClient(app) as client:
+        yield client, service
+        service.release.set()
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_size_priority():
+    assert size_priority({"size": "10.5GB"}) == 10.5
+    assert size_priority({"size": "512MB"}) == 0.5
+    assert size_priority({"size": "Adapter"}) == float("inf")
+    assert size_priority(None) == float("inf")
+
+def test_duplicate_download_reports_already_queued(client):
+    client, service = client
+    assert client.post("/models/download", json={"model_id": "org/model-0"}).json()["status"] == "queued"
+    assert client.post("/models/download", json={"model_id": "org/model-0"}).json()["status"] == "already_queued"
+
+def test_queued_models_show_in_status(client):
+    client, service = client
+    client.post("/models/download", json={"model_id": "org/model-0"})
+    wait_for(lambda: "org/model-0" in service.downloading)
+    # The only worker is busy, so this one waits in the queue
+    client.post("/models/download", json={"model_id": "org/model-1"})
+
+    status = {m["id"]: m for m in client.get("/models").json()}
+    assert status["org/model-0"]["downloading"] and "queued" not in status["org/model-0"]
+    assert status["org/model-1"]["downloading"] and status["org/model-1"]["queued"]
+    assert not status["org/model-2"]["downloading"]
+
+    streamed = [line for line in client.get("/models/stream").text.splitlines() if line]
+    assert '"queued":true' in streamed[1]
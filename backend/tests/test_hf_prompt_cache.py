@@ -0,0 +1,42 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.engine.hf_prompt_cache import HFPromptCachePool
+
+class FakeCache:
+    def __init__(self, length):
+        self.length = length
+
+    def get_seq_length(self):
+        return self.length
+
+    def crop(self, length):
+        self.length = length
+
+def ids(*values):
+    return torch.tensor(values)
+
+def test_long_shared_prefix_is_reused_and_cropped():
+    pool = HFPromptCachePool(min_prefix=4)
+    pool.store("m", ids(1, 2, 3, 4, 5, 6, 7, 8), FakeCache(8))
+    cache = pool.fetch("m", ids(1, 2, 3, 4, 5, 6, 9, 9))
+    assert cache is not None and cache.get_seq_length() == 6
+
+def test_short_shared_prefix_leaves_entry_untouched():
+    pool = HFPromptCachePool(min_prefix=4)
+    cache = FakeCache(8)
+    pool.store("m", ids(1, 2, 3, 4, 5, 6, 7, 8), cache)
+
+    # Only the BOS token in common: an unrelated conversation
+    assert pool.fetch("m", ids(1, 9, 9, 9, 9)) is None
+    assert cache.get_seq_length() == 8
+
+    # Its own conversation still finds it intact
+    assert pool.fetch("m", ids(1, 2, 3, 4, 5, 6, 7, 8, 10)) is cache
+    assert cache.get_seq_length() == 8
+
+def test_other_models_never_match():
+    pool = HFPromptCachePool(min_prefix=1)
+    pool.store("a", ids(1, 2, 3, 4), FakeCache(4))
+    assert pool.fetch("b", ids(1, 2, 3, 4, 5)) is None
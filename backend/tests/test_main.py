@@ -0,0 +1,13 @@
+import warnings
+
+from fastapi.testclient import TestClient
+
+import main
+
+def test_responses_are_orjson_without_deprecation_warnings():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        response = TestClient(main.app).get("/health")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok", "service": "silicon-studio-engine"}
+    assert response.headers["content-type"] == "application/json"
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+pytest.importorskip("mlx_lm")
+
+from app.engine.mlx_datasets import prune_dataset_cache
+
+def make_entry(root, name, size, age):
+    entry = root / name
+    entry.mkdir()
+    (entry / "ids.bin").write_bytes(b"\0" * size)
+    os.utime(entry, (age, age))
+    return entry
+
+def test_prune_removes_least_recently_used_first(tmp_path):
+    old = make_entry(tmp_path, "old", 100, 1_000)
+    mid = make_entry(tmp_path, "mid", 100, 2_000)
+    new = make_entry(tmp_path, "new", 100, 3_000)
+
+    prune_dataset_cache(tmp_path, max_bytes=200)
+    assert not old.exists() and mid.exists() and new.exists()
+
+def test_prune_spares_kept_and_in_progress_entries(tmp_path):
+    kept = make_entry(tmp_path, "kept", 100, 1_000)
+    partial = make_entry(tmp_path, "other.tmp", 100, 1_500)
+    stale = make_entry(tmp_path, "stale", 100, 2_000)
+    fresh = make_entry(tmp_path, "fresh", 100, 3_000)
+
+    prune_dataset_cache(tmp_path, keep={"kept"}, max_bytes=150)
+    assert kept.exists() and partial.exists()
+    assert not stale.exists() and not fresh.exists()
+
+def test_prune_ignores_a_missing_cache(tmp_path):
+    prune_dataset_cache(tmp_path / "absent", max_bytes=0)
@@ -0,0 +1,45 @@
+import json
+
+from app.engine.model_store import ModelStore
+
+CATALOG = [
+    {"id": "mlx-community/a", "name": "A", "size": "1.0GB", "family": "Llama"},
+    {"id": "mlx-community/b", "name": "B", "size": "2.0GB", "family": "Qwen"},
+    {"id": "ft-1234", "name": "My Fine-Tune", "is_custom": True, "is_finetuned": True, "adapter_path": "adapters/ft-1234"},
+]
+
+def write_catalog(path, entries):
+    path.write_text(json.dumps(entries))
+    return path
+
+def test_seeds_catalog_in_order(tmp_path):
+    seed = write_catalog(tmp_path / "models.json", CATALOG)
+    store = ModelStore(tmp_path / "models.db", seed_path=seed)
+    assert store.all() == CATALOG
+
+def test_upsert_and_delete(tmp_path):
+    store = ModelStore(tmp_path / "models.db")
+    store.upsert({"id": "/models/x", "name": "X", "is_custom": True})
+    store.upsert({"id": "/models/x", "name": "Renamed", "is_custom": True})
+    assert store.all() == [{"id": "/models/x", "name": "Renamed", "is_custom": True}]
+    store.delete("/models/x")
+    assert store.all() == []
+
+def test_deleted_models_stay_deleted_after_restart(tmp_path):
+    seed = write_catalog(tmp_path / "models.json", CATALOG)
+    store = ModelStore(tmp_path / "models.db", seed_path=seed)
+    store.delete("ft-1234")
+    store.delete("mlx-community/a")
+
+    reopened = ModelStore(tmp_path / "models.db", seed_path=seed)
+    assert [m["id"] for m in reopened.all()] == ["mlx-community/b"]
+
+def test_new_catalog_entries_are_added_on_restart(tmp_path):
+    seed = write_catalog(tmp_path / "models.json", CATALOG)
+    store = ModelStore(tmp_path / "models.db", seed_path=seed)
+    store.upsert({"id": "/models/custom", "name": "Custom", "is_custom": True})
+
+    added = {"id": "mlx-community/c", "name": "C", "size": "3.0GB", "family": "Gemma"}
+    write_catalog(seed, CATALOG + [added])
+    reopened = ModelStore(tmp_path / "models.db", seed_path=seed)
+    assert [m["id"] for m in reopened.all()] == [m["id"] for m in CATALOG] + ["/models/custom", "mlx-community/c"]
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from app.preparation import service as prep
+from app.preparation.service import DataPreparationService
+
+CSV = (
+    "instruction,input,output,extra\n"
+    "Summarize,The cat sat.,A cat sat.,x\n"
+    "Say hi,,Hello!,y\n"
+    "Translate to French,cheese,,z\n"
+)
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line)["text"] for line in f]
+
+@pytest.fixture(params=["c", "pyarrow"])
+def csv_engine(request, monkeypatch):
+    if request.param == "pyarrow":
+        pytest.importorskip("pyarrow")
+    monkeypatch.setattr(prep, "CSV_ENGINE", request.param)
+    return request.param
+
+def test_template_columns_match_row_template():
+    import pandas as pd
+    svc = DataPreparationService()
+    rows = [("Summarize", "The cat sat.", "A cat sat."), ("Say hi", "", "Hello!")]
+    for family in ["Llama", "Mistral", "Qwen", "Gemma", "Phi", "Base"]:
+        columns = svc.apply_prompt_template_columns(*(pd.Series(col) for col in zip(*rows)), family)
+        assert columns.tolist() == [svc.apply_prompt_template(*row, family) for row in rows]
+
+def test_blank_cells_become_empty_strings(tmp_path, csv_engine):
+    src = tmp_path / "data.csv"
+    src.write_text(CSV)
+    out = tmp_path / "out.jsonl"
+
+    result = DataPreparationService().convert_csv_to_jsonl(str(src), str(out), "instruction", "input", "output", model_family="Base")
+
+    assert result["rows"] == 3
+    texts = read_jsonl(out)
+    assert texts[1] == "### Instruction:\nSay hi\n\n### Input:\n\n\n### Response:\nHello!"
+    assert texts[2] == "### Instruction:\nTranslate to French\n\n### Input:\ncheese\n\n### Response:\n"
+    assert not any("nan" in t or "None" in t for t in texts)
+
+def test_output_does_not_depend_on_csv_engine(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    src = tmp_path / "data.csv"
+    src.write_text(CSV)
+    outputs = {}
+    for engine in ["c", "pyarrow"]:
+        monkeypatch.setattr(prep, "CSV_ENGINE", engine)
+        out = tmp_path / f"{engine}.jsonl"
+        DataPreparationService().convert_csv_to_jsonl(str(src), str(out), "instruction", "input", "output", model_family="Llama")
+        outputs[engine] = read_jsonl(out)
+    assert outputs["c"] == outputs["pyarrow"]
+
+def test_missing_input_column_is_empty(tmp_path, csv_engine):
+    src = tmp_path / "data.csv"
+    src.write_text(CSV)
+    out = tmp_path / "out.jsonl"
+    DataPreparationService().convert_csv_to_jsonl(str(src), str(out), "instruction", None, "output", model_family="Qwen")
+    assert read_jsonl(out)[0] == "<|im_start|>user\nSummarize<|im_end|>\n<|im_start|>assistant\nA cat sat.<|im_end|>\n"
+
+def test_preview_uses_none_for_blank_cells(tmp_path):
+    src = tmp_path / "data.csv"
+    src.write_text(CSV)
+    rows = DataPreparationService().preview_csv(str(src), limit=2)
+    assert rows[1]["input"] is None
+    assert len(rows) == 2
@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip("mlx_lm")
+
+from app.engine import prompt_cache
+from app.engine.prompt_cache import PromptCachePool, _block_digests
+
+BLOCK = prompt_cache.PREFIX_BLOCK_TOKENS
+
+class FakeLayer:
+    def __init__(self, offset):
+        self.offset = offset
+        self.state = ()
+
+    def is_trimmable(self):
+        return True
+
+    def trim(self, n):
+        self.offset -= n
+        return n
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(prompt_cache, "make_prompt_cache", lambda model: ["fresh"])
+
+def test_block_digests_are_cumulative():
+    tokens = list(range(3 * BLOCK + 5))
+    digests = _block_digests("m", tokens)
+    assert len(digests) == 3 # partial trailing block is not indexed
+    assert _block_digests("m", tokens[:2 * BLOCK]) == digests[:2]
+    assert len(set(digests)) == 3
+
+def test_block_digests_depend_on_model_and_earlier_blocks():
+    tokens = list(range(2 * BLOCK))
+    assert _block_digests("a", tokens) != _block_digests("b", tokens)
+
+    changed = [99] + tokens[1:]
+    assert _block_digests("m", changed)[1] != _block_digests("m", tokens)[1]
+
+def test_whole_entry_prefix_is_checked_out():
+    pool = PromptCachePool()
+    tokens = list(range(2 * BLOCK))
+    cache = [FakeLayer(len(tokens))]
+    pool.store("m", tokens, cache)
+
+    got, rest = pool.fetch("m", None, tokens + [7, 8])
+    assert got is cache and rest == [7, 8]
+    # Checked out exclusively
+    assert pool.fetch("m", None, tokens + [7, 8]) == (["fresh"], tokens + [7, 8])
+
+def test_partial_match_is_trimmed_to_shared_prefix():
+    pool = PromptCachePool()
+    tokens = list(range(2 * BLOCK))
+    cache = [FakeLayer(len(tokens))]
+    pool.store("m", tokens, cache)
+
+    prompt = tokens[:BLOCK + 3] + [-1, -2]
+    got, rest = pool.fetch("m", None, prompt)
+    assert got is cache and rest == [-1, -2]
+    assert cache[0].offset == BLOCK + 3
+
+def test_no_match_across_models_or_short_prefixes():
+    pool = PromptCachePool()
+    tokens = list(range(2 * BLOCK))
+    pool.store("a", tokens, [FakeLayer(len(tokens))])
+
+    assert pool.fetch("b", None, tokens + [1]) == (["fresh"], tokens + [1])
+    # Shorter than one block: nothing is indexed to match against
+    short = tokens[:BLOCK - 1] + [-1]
+    assert pool.fetch("a", None, short) == (["fresh"], short)
+
+def test_drop_and_eviction_clear_the_index():
+    pool = PromptCachePool(max_entries=1)
+    first, second = list(range(BLOCK)), list(range(100, 100 + BLOCK))
+    pool.store("m", first, [FakeLayer(BLOCK)])
+    pool.store("m", second, [FakeLayer(BLOCK)])
+    assert len(pool._entries) == 1
+    assert all(key in pool._entries for keys in pool._index.values() for key in keys)
+
+    pool.drop("m")
+    assert not pool._entries and not pool._index